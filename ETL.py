@@ -1,35 +1,503 @@
-import pandas as pd
+import argparse
+import glob
+import io
+import json
 import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-output_dir = "etl_output"
-os.makedirs(output_dir, exist_ok=True)
-
-df = pd.read_csv("data.csv")
-
-dim_patient = df[['patient_id', 'gender', 'age', 'race']].drop_duplicates().reset_index(drop=True)
-dim_patient['patient_key'] = dim_patient.index + 1 
-
-dim_hospital = df[['Hospital']].drop_duplicates().reset_index(drop=True)
-dim_hospital['hospital_key'] = dim_hospital.index + 1
-
-dim_diagnosis = df[['icd_code', 'icd_version', 'diagnosis_description']].drop_duplicates().reset_index(drop=True)
-dim_diagnosis['diagnosis_key'] = dim_diagnosis.index + 1
-
-fact_admissions = df.merge(dim_patient, on=['patient_id', 'gender', 'age', 'race'], how='left')
+import pandas as pd
 
-fact_admissions = fact_admissions.merge(dim_hospital, on='Hospital', how='left')
+from database import database_files, require_engine, write_database
+from distinct import DistinctCounts, distinct_file
+from headline import build_headline, headline_file, save_headline
+from instrumentation import export, format_trace, phase, start_trace
+from readmissions import (
+    admission_columns, interval_table, intervals, rate_table, readmission_rates, update_intervals, update_rates
+)
+from star_schema import (
+    PartitionWriter, TableWriter, add_patient_labels, append_table, current_dir, formats, iter_admissions,
+    partitions_dir, path_format, read_table, read_table_chunks, require_pyarrow, set_current, table_path,
+    version_name, versions_dir, versions_to_keep, write_table
+)
+from summaries import finish_summaries, merge_summaries, partial_summaries, sum_columns, summary_tables
+from trends import merge_rollups, rollups, trend_table
 
-fact_admissions = fact_admissions.merge(dim_diagnosis, on=['icd_code', 'icd_version', 'diagnosis_description'], how='left')
+# natural key columns and surrogate key of each dimension
+dimensions = {
+    "dim_patient": (['patient_id', 'gender', 'age', 'race'], 'patient_key'),
+    "dim_hospital": (['Hospital'], 'hospital_key'),
+    "dim_diagnosis": (['icd_code', 'icd_version', 'diagnosis_description'], 'diagnosis_key'),
+}
 
-fact_admissions = fact_admissions[[
+fact_columns = [
     'admission_id', 'patient_key', 'hospital_key', 'diagnosis_key',
     'admission_type', 'admission_location', 'discharge_location',
     'admittime', 'dischtime', 'length_of_stay',
     'cci_score', 'ed_visit_count',
     'lace_l_score', 'lace_a_score', 'lace_e_score', 'lace_score'
-]]
+]
+
+# remembers how far into each source file previous runs have read
+state_file = "etl_state.json"
+
+
+class DimensionKeys:
+    # natural key -> surrogate key lookup for one dimension, built up chunk by chunk.
+    # unseen members get the next keys in order of first appearance, existing keys never change
+    def __init__(self, columns, key, dim=None):
+        self.columns = columns
+        self.key = key
+        self.keys = {}
+        self.new_members = []
+        if dim is not None:
+            for *member, member_key in dim[columns + [key]].itertuples(index=False, name=None):
+                self.keys[self._normalize(member)] = member_key
+        self.next_key = max(self.keys.values(), default=0) + 1
+
+    @staticmethod
+    def _normalize(member):
+        # NaN never equals itself, so missing values are stored as None
+        return tuple(None if pd.isna(value) else value for value in member)
+
+    def lookup(self, chunk):
+        # the chunk's distinct members with their keys, adding any unseen ones
+        members = chunk[self.columns].drop_duplicates()
+        keys = []
+        for member in members.itertuples(index=False, name=None):
+            normalized = self._normalize(member)
+            key = self.keys.get(normalized)
+            if key is None:
+                key = self.keys[normalized] = self.next_key
+                self.next_key += 1
+                self.new_members.append(member + (key,))
+            keys.append(key)
+        members[self.key] = keys
+        return members
+
+    def new_members_frame(self):
+        return pd.DataFrame(self.new_members, columns=self.columns + [self.key])
+
+
+def prepare_chunk(chunk):
+    # each dimension's distinct members in order of first appearance, so key assignment
+    # only has to walk those instead of every row
+    return chunk, {name: chunk[columns].drop_duplicates() for name, (columns, _) in dimensions.items()}
+
+
+def add_keys(chunk, members, dimension_keys):
+    # the chunk with every dimension's surrogate key
+    for name, keys in dimension_keys.items():
+        chunk = chunk.merge(keys.lookup(members[name]), on=keys.columns, how='left')
+    return chunk
+
+
+def build_fact_rows(chunk, members, dimension_keys):
+    return add_keys(chunk, members, dimension_keys)[fact_columns]
+
+
+def read_admission_columns(output_dir):
+    # the interval table's admission columns of every stored admission, for output of an older ETL
+    fact = read_table("fact_admissions", output_dir, columns=[
+        "admission_id", "patient_key", "hospital_key", "diagnosis_key", "lace_score", "admittime", "dischtime",
+    ])
+    patients = read_table("dim_patient", output_dir, columns=["patient_key", "patient_id"])
+    diagnoses = read_table("dim_diagnosis", output_dir, columns=["diagnosis_key", "diagnosis_description"])
+    fact = fact.merge(patients, on="patient_key", how="left").merge(diagnoses, on="diagnosis_key", how="left")
+    return fact[admission_columns]
+
+
+def read_dimension(name, output_dir):
+    dim = read_table(name, output_dir)
+    # compare natural keys as plain values, not as categoricals
+    for column in dim.select_dtypes("category").columns:
+        dim[column] = dim[column].astype(dim[column].cat.categories.dtype)
+    return dim
+
+
+def load_state(output_dir):
+    path = os.path.join(output_dir, state_file)
+    if not os.path.exists(path):
+        return {"sources": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, output_dir):
+    path = os.path.join(output_dir, state_file)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def read_source(source, offset=0, chunksize=None):
+    # yields the rows after `offset` bytes of the source, in chunks of `chunksize` rows if given
+    names = list(pd.read_csv(source, nrows=0).columns)
+    with open(source, "rb") as f:
+        if offset:
+            f.seek(offset)
+            reader = pd.read_csv(f, header=None, names=names, chunksize=chunksize)
+        else:
+            reader = pd.read_csv(f, chunksize=chunksize)
+
+        if chunksize is None:
+            yield reader
+        else:
+            yield from reader
+
+
+def byte_ranges(source, offset, chunksize):
+    # splits the rows after `offset` bytes into line aligned byte ranges of about `chunksize` rows,
+    # going by the length of the first rows, so workers can each parse a piece of one file
+    with open(source, "rb") as f:
+        f.readline()  # header
+        start = max(offset, f.tell())
+        f.seek(start)
+        sample = [line for line in (f.readline() for _ in range(1000)) if line]
+        step = max(1, chunksize * sum(map(len, sample)) // max(1, len(sample)))
+        end = f.seek(0, os.SEEK_END)
+        while start < end:
+            f.seek(min(start + step, end))
+            f.readline()  # on to the end of the row the range ends in
+            stop = min(f.tell(), end)
+            yield start, stop
+            start = stop
+
+
+def read_range(source, start, end):
+    names = list(pd.read_csv(source, nrows=0).columns)
+    with open(source, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return pd.read_csv(io.BytesIO(data), header=None, names=names)
+
+
+def read_and_prepare(path, offset, end=None):
+    # runs in a worker process: parse one whole source file, or only bytes offset..end of it,
+    # and pre-deduplicate the members
+    if end is not None:
+        return [prepare_chunk(read_range(path, offset, end))]
+    return [prepare_chunk(chunk) for chunk in read_source(path, offset)]
+
+
+def source_files(source):
+    # a single file, every csv in a directory, or a glob pattern. sorted, so the order keys
+    # are handed out in never depends on directory listing order or on the number of workers
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, "*.csv"))
+    elif any(c in source for c in "*?["):
+        paths = glob.glob(source)
+    else:
+        paths = [source]
+    if not paths:
+        raise SystemExit(f"no source files match {source}")
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def prepared_chunks(files, workers, chunksize=None):
+    # (chunk, members) in file order. with several workers each file, or with a chunksize each piece
+    # of about that many rows, is parsed in its own process, and at most 2 tasks per worker are in
+    # flight, so finished ones don't pile up in memory
+    if workers <= 1 or (len(files) <= 1 and chunksize is None):
+        for path, offset in files:
+            for chunk in read_source(path, offset, chunksize):
+                yield prepare_chunk(chunk)
+        return
+
+    if chunksize is None:
+        tasks = ((path, offset) for path, offset in files)
+    else:
+        tasks = ((path, start, end) for path, offset in files for start, end in byte_ranges(path, offset, chunksize))
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(read_and_prepare, *task))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def run(args, state):
+    fmt = args.format
+    incremental = args.incremental
+    if incremental:
+        try:
+            fmt = path_format(table_path("fact_admissions", args.output_dir))
+        except FileNotFoundError:
+            print("no existing ETL output, running a full build")
+            incremental = False
+
+    # only rows appended since the last run are read; a source that shrank, or was rewritten at the same
+    # size, was replaced, so it is read again (rows already loaded are skipped below)
+    stats = {path: os.stat(path) for path in source_files(args.source)}
+    sizes = {path: stat.st_size for path, stat in stats.items()}
+    modified = {path: stat.st_mtime_ns for path, stat in stats.items()}
+    files = []
+    for path, size in sizes.items():
+        offset = state["sources"].get(path, 0) if incremental else 0
+        recorded = state.get("modified", {}).get(path)
+        if offset > size or (offset == size and recorded is not None and recorded != modified[path]):
+            offset = 0
+        if offset < size:
+            files.append((path, offset))
+
+    phase("existing tables")
+    existing = {}
+    loaded_ids = None
+    stored = None  # summary tables of the stored admissions, which an incremental run adds to
+    distinct = DistinctCounts.empty()  # patient sets, likewise
+    if incremental:
+        existing = {name: read_dimension(name, args.output_dir) for name in dimensions}
+        loaded_ids = read_table("fact_admissions", args.output_dir, columns=["admission_id"])["admission_id"]
+        try:
+            stored = {name: read_table(name, args.output_dir) for name in summary_tables}
+            distinct = DistinctCounts.load(os.path.join(args.output_dir, distinct_file))
+        except FileNotFoundError:
+            stored = None
+        if stored is not None and not set(sum_columns) <= set(stored["summary_metrics"].columns):
+            stored = None
+
+    dimension_keys = {
+        name: DimensionKeys(columns, key, existing.get(name))
+        for name, (columns, key) in dimensions.items()
+    }
+
+    # distinct patients are counted by patient_id; one with several patient_keys (age changed between
+    # admissions) is represented by its lowest key, the first one it got
+    first_keys = {}
+    if incremental:
+        first_keys = existing["dim_patient"].groupby("patient_id")["patient_key"].min().to_dict()
+
+    summary_parts = []  # partial summaries of the new admissions, added up as chunks come in
+
+    def summarise(rows):
+        # adds rows with the merged frame's columns to the summaries and the patient sets
+        for patient_id, patient_key in rows.groupby("patient_id")["patient_key"].min().items():
+            first_keys.setdefault(patient_id, patient_key)
+        distinct.update(rows.assign(patient=[first_keys[patient_id] for patient_id in rows["patient_id"].tolist()]))
+        summary_parts.append(partial_summaries(rows))
+        if len(summary_parts) > 32:
+            summary_parts[:] = [merge_summaries(summary_parts)]
+
+    # per hospital copies of the fact table. an incremental run only adds to the partitions of the
+    # hospitals it got admissions for, output from an older ETL without partitions gets them from
+    # the whole fact table once it's written
+    partitions = os.path.join(args.output_dir, partitions_dir)
+    backfill_partitions = incremental and not os.path.isdir(partitions)
+    if not incremental:
+        shutil.rmtree(partitions, ignore_errors=True)
+    partition_writer = PartitionWriter(args.output_dir, fmt, append=incremental)
+
+    # fact rows, partitions and the summaries are written or added to as each chunk completes, only the
+    # dimension lookups, the patient sets and the readmission columns of the new admissions stay in memory
+    fact_writer = TableWriter("fact_admissions", args.output_dir, fmt, append=incremental)
+    trend_parts = []  # trend rollups of the new admissions, added up as chunks come in
+    new_admissions = []  # admission_columns of the new admissions, for the readmission intervals
+    phase("parse + dimension keys + fact rows + summaries")
+    for chunk, members in prepared_chunks(files, args.workers, args.chunksize):
+        if loaded_ids is not None:
+            # admissions already in the fact table are skipped, so re-running a feed is harmless
+            loaded = chunk["admission_id"].isin(loaded_ids)
+            if loaded.any():
+                chunk, members = prepare_chunk(chunk[~loaded])
+        if not chunk.empty:
+            rows = add_keys(chunk, members, dimension_keys)
+            fact_rows = rows[fact_columns]
+            new_admissions.append(rows[admission_columns].assign(
+                admittime=pd.to_datetime(rows["admittime"]), dischtime=pd.to_datetime(rows["dischtime"])
+            ))
+            trend_parts.append(rollups(fact_rows))
+            if len(trend_parts) > 32:
+                trend_parts = [merge_rollups(trend_parts)]
+            summarise(add_patient_labels(rows))
+            fact_writer.write(fact_rows)
+            if not backfill_partitions:
+                partition_writer.write(fact_rows)
+    fact_writer.close()
+    if backfill_partitions:
+        phase("partitions")
+        for fact_rows in read_table_chunks("fact_admissions", args.output_dir, args.chunksize or 100_000):
+            partition_writer.write(fact_rows)
+    partition_writer.close()
+
+    phase("trend rollups")
+    # an incremental run adds the new admissions' rollups to the existing ones; output from an
+    # ETL that had no trend table gets one worked out from the whole fact table
+    if incremental:
+        try:
+            trend_parts.append(read_table(trend_table, args.output_dir))
+        except FileNotFoundError:
+            fact = read_table("fact_admissions", args.output_dir,
+                              columns=["hospital_key", "admittime", "length_of_stay", "lace_score"])
+            trend_parts = [rollups(fact)]
+    write_table(merge_rollups(trend_parts), trend_table, args.output_dir, fmt)
+
+    phase("dimension tables")
+    for name, keys in dimension_keys.items():
+        new_members = keys.new_members_frame()
+        if name == "dim_patient":
+            new_members = add_patient_labels(new_members)
+
+        if not incremental:
+            write_table(new_members, name, args.output_dir, fmt)
+        elif list(existing[name].columns) == list(new_members.columns):
+            append_table(new_members, name, args.output_dir, fmt)
+        else:
+            # output from an older ETL without the derived columns, rewrite it once in the current layout
+            dim = pd.concat([existing[name], keys.new_members_frame()], ignore_index=True)
+            if name == "dim_patient":
+                dim = add_patient_labels(dim)
+            write_table(dim, name, args.output_dir, fmt)
+
+    # days to each patient's next admission. an incremental run only works out the patients with new
+    # admissions again, from their stored intervals, and updates the counts by the rows that changed;
+    # output from an older ETL gets them for everyone
+    phase("readmissions")
+    new_admissions = pd.concat(new_admissions, ignore_index=True) if new_admissions \
+        else pd.DataFrame(columns=admission_columns)
+    previous = None
+    if incremental:
+        try:
+            previous = read_table(interval_table, args.output_dir)
+            rates = read_table(rate_table, args.output_dir)
+        except FileNotFoundError:
+            pass
+    if previous is not None and set(admission_columns) <= set(previous.columns):
+        readmits, replaced, recomputed = update_intervals(previous, new_admissions)
+        rates = update_rates(rates, replaced, recomputed)
+    else:
+        readmits = intervals(read_admission_columns(args.output_dir) if incremental else new_admissions)
+        rates = readmission_rates(readmits)
+    write_table(readmits, interval_table, args.output_dir, fmt)
+    write_table(rates, rate_table, args.output_dir, fmt)
+
+    # an incremental run adds its admissions to the stored summaries and patient sets; output from an
+    # older ETL without the sums behind the averages or the patient sets gets them from the whole
+    # fact table, a chunk at a time
+    if incremental and stored is None:
+        phase("summaries of the stored admissions")
+        summary_parts.clear()
+        distinct = DistinctCounts.empty()
+        for rows in iter_admissions(args.output_dir, args.chunksize or 100_000):
+            summarise(rows)
+
+    phase("distinct counts")
+    distinct.save(os.path.join(args.output_dir, distinct_file))
+
+    phase("summaries")
+    if stored is not None:
+        summary_parts.append(stored)
+    patients = distinct.sizes().rename(columns={"column": "dimension"})
+    summaries = finish_summaries(merge_summaries(summary_parts), patients)
+    for name, table in summaries.items():
+        write_table(table, name, args.output_dir, fmt)
+    save_headline(build_headline(summaries, rates), os.path.join(args.output_dir, headline_file))
+    if args.database:
+        phase("database")
+        write_database(args.output_dir, args.database)
+
+    if incremental:
+        state["sources"].update(sizes)
+        state.setdefault("modified", {}).update(modified)
+        added = ", ".join(f"{len(keys.new_members)} {name}" for name, keys in dimension_keys.items())
+        print(f"appended {fact_writer.rows} admissions ({added}) to {args.output_dir}")
+    else:
+        state["sources"] = sizes
+        state["modified"] = modified
+        print(f"wrote {fact_writer.rows} admissions to {args.output_dir}")
+
+
+def build(args):
+    require_pyarrow(args.format)
+    if args.database:
+        require_engine(args.database)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    state = load_state(args.output_dir)
+    trace = start_trace("etl")
+    try:
+        run(args, state)
+    finally:
+        trace.finish()
+        if args.trace_log:
+            export(trace, args.trace_log)
+    if args.timings:
+        print(format_trace(trace))
+    save_state(state, args.output_dir)
+
+
+def publish(args):
+    # builds a new version of the output next to the live one and then points CURRENT at it.
+    # --incremental starts from a copy of the live version (a real copy, csv tables are appended to in place)
+    versions = os.path.join(args.output_dir, versions_dir)
+    os.makedirs(versions, exist_ok=True)
+    live = current_dir(args.output_dir)
+    has_live = live != args.output_dir and os.path.isdir(live)
+
+    name = version_name()
+    staging = os.path.join(versions, name + ".staging")
+    try:
+        if args.incremental and has_live:
+            shutil.copytree(live, staging)
+        build(argparse.Namespace(**{**vars(args), "output_dir": staging, "incremental": args.incremental and has_live}))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    os.rename(staging, os.path.join(versions, name))
+    set_current(args.output_dir, name)
+    print(f"published {name}")
+
+    # older versions are kept for a while, a dashboard may still be reading one
+    published = sorted(entry for entry in os.listdir(versions) if not entry.endswith(".staging"))
+    for old in published[:-args.keep]:
+        shutil.rmtree(os.path.join(versions, old), ignore_errors=True)
+    return name
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Build the star schema tables used by the dashboard.")
+    parser.add_argument("--source", default="data.csv",
+                        help="source admissions CSV, or a folder / glob of CSVs (e.g. one per hospital per month)")
+    parser.add_argument("--output-dir", default="etl_output", help="folder the tables are written to")
+    parser.add_argument("--format", choices=list(formats), default="csv",
+                        help="csv, or typed columnar parquet / arrow (IPC) files, which load much faster")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only load source rows added since the last run and append them, keeping existing keys; "
+                             "uses the format of the existing output")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="stream the source in chunks of this many rows, so peak memory is bounded by the "
+                             "chunk size plus the dimension tables instead of the whole source")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parse several source files (with --chunksize, pieces of files) in parallel in this "
+                             "many processes; keys come out the same whatever the number of workers")
+    parser.add_argument("--database", choices=list(database_files), default=None,
+                        help="also load the tables into an embedded sqlite or duckdb database, which the dashboard "
+                             "queries instead of holding the data in memory (start it with DASHBOARD_BACKEND)")
+    parser.add_argument("--publish", action="store_true",
+                        help="write a new version under <output-dir>/versions and switch the dashboard to it "
+                             "once it's complete, instead of writing into <output-dir> directly")
+    parser.add_argument("--keep", type=versions_to_keep, default=3,
+                        help="published versions to keep, the live one included (with --publish)")
+    parser.add_argument("--timings", action="store_true",
+                        help="print the time and peak memory growth of each ETL step when done")
+    parser.add_argument("--trace-log", default=None,
+                        help="append each run's step timings to this file as a JSON line (see instrumentation.py)")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.publish:
+        publish(args)
+        return
+    if current_dir(args.output_dir) != args.output_dir:
+        print(f"note: {args.output_dir} has published versions, the dashboard reads "
+              f"{current_dir(args.output_dir)}; use --publish to update it")
+    build(args)
+
 
-dim_patient.to_csv(os.path.join(output_dir, "dim_patient.csv"), index=False)
-dim_hospital.to_csv(os.path.join(output_dir, "dim_hospital.csv"), index=False)
-dim_diagnosis.to_csv(os.path.join(output_dir, "dim_diagnosis.csv"), index=False)
-fact_admissions.to_csv(os.path.join(output_dir, "fact_admissions.csv"), index=False)
+if __name__ == "__main__":
+    main()
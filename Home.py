@@ -1,93 +1,28 @@
-import streamlit as st
-import pandas as pd
-import altair as alt
+from functools import partial
 
-st.set_page_config(page_title="Patient Dashboard", layout="wide")
+import streamlit as st
 
-<<<<<<< HEAD
-def load_data():
-    import pandas as pd
-    import os
+import debug_panel
+from binning import histogram
+from chart_cache import chart_spec, chart_specs
+from data_loader import load_headline, load_readmissions, load_summaries
+from headline import headline_metrics
+from instrumentation import start_trace
+from readmissions import lace_bands, rates_by
+from summaries import counts_by
 
-    output_dir = "etl_output"  # folder where your ETL CSVs are saved
-    
-    # Load dimension tables
-    dim_patient = pd.read_csv(os.path.join(output_dir, "dim_patient.csv"))
-    dim_hospital = pd.read_csv(os.path.join(output_dir, "dim_hospital.csv"))
-    dim_diagnosis = pd.read_csv(os.path.join(output_dir, "dim_diagnosis.csv"))
-    
-    # Load fact table
-    fact_admissions = pd.read_csv(os.path.join(output_dir, "fact_admissions.csv"))
-    
-    # Merge dimensions to fact table to reconstruct original columns needed for dashboard
-    df = fact_admissions.merge(dim_patient, on="patient_key", how="left") \
-                        .merge(dim_hospital, on="hospital_key", how="left") \
-                        .merge(dim_diagnosis, on="diagnosis_key", how="left")
-    
-    # Now df contains columns from all dims and fact; rename 'Hospital' for consistency
-    df.rename(columns={"Hospital": "Hospital"}, inplace=True)
-    
-    # Add race_category and gender_label as before
-    race_grouped = {
-        'White': [
-            'WHITE', 
-            'WHITE - OTHER EUROPEAN', 
-            'WHITE - RUSSIAN', 
-            'WHITE - BRAZILIAN', 
-            'WHITE - EASTERN EUROPEAN'
-        ],
-        'Black': [
-            'BLACK/AFRICAN AMERICAN', 
-            'BLACK/CARIBBEAN ISLAND', 
-            'BLACK/AFRICAN', 
-            'BLACK/CAPE VERDEAN'
-        ],
-        'Hispanic': [
-            'HISPANIC/LATINO - PUERTO RICAN', 
-            'HISPANIC/LATINO - HONDURAN', 
-            'HISPANIC/LATINO - DOMINICAN', 
-            'HISPANIC/LATINO - MEXICAN', 
-            'HISPANIC/LATINO - SALVADORAN', 
-            'HISPANIC/LATINO - GUATEMALAN', 
-            'HISPANIC/LATINO - COLUMBIAN', 
-            'HISPANIC/LATINO - CUBAN', 
-            'HISPANIC/LATINO - CENTRAL AMERICAN', 
-            'HISPANIC OR LATINO'
-        ],
-        'Asian': [
-            'ASIAN - SOUTH EAST ASIAN', 
-            'ASIAN', 
-            'ASIAN - CHINESE', 
-            'ASIAN - KOREAN', 
-            'ASIAN - ASIAN INDIAN'
-        ],
-        'Other': [
-            'OTHER', 
-            'UNKNOWN', 
-            'UNABLE TO OBTAIN', 
-            'PATIENT DECLINED TO ANSWER', 
-            'SOUTH AMERICAN', 
-            'PORTUGUESE',
-            'NATIVE HAWAIIAN OR OTHER PACIFIC ISLANDER',
-            'AMERICAN INDIAN/ALASKA NATIVE'
-        ]
-    }
-    def group_races(race_value):
-        for category, races in race_grouped.items():
-            if race_value in races:
-                return category
-        return 'Other/Unknown'
-
-    df['race_category'] = df['race'].apply(group_races)
-    df['gender_label'] = df['gender'].map({'M': 'Male', 'F': 'Female'})
+st.set_page_config(page_title="Patient Dashboard", layout="wide")
 
-    return df
+# timings of this rerun, in the sidebar with ?debug=1 (see debug_panel.py)
+trace = start_trace("Home")
+trace.phase("load")
 
-df = load_data()
+# the metrics come from the ETL's small headline file and are on screen before anything the charts need is loaded
+headline = load_headline()
 
 # bar chart
 def create_bar(group_column, title, bar_size=20):
-    group_counts = df.groupby(group_column)["patient_id"].nunique().reset_index()
+    group_counts = counts_by(summary, group_column)
     group_counts.columns = [group_column, "Patient Count"]
     group_counts = group_counts.sort_values(by=group_column, ascending=True)
     
@@ -117,7 +52,7 @@ def create_bar(group_column, title, bar_size=20):
 
 # pie chart for race
 def race_pie(group_column, title):
-    group_counts = df[group_column].value_counts().reset_index()
+    group_counts = counts_by(summary, group_column, measure="admissions")
     group_counts.columns = [group_column, "Count"]
 
     chart = alt.Chart(group_counts).mark_arc(innerRadius=50).encode(
@@ -134,12 +69,9 @@ def race_pie(group_column, title):
     )
     return chart
 
-# pie chart for genders (male blue and female pink), mapped M to male and F to female for visual clarity on chart
-
-df['gender_label'] = df['gender'].map({'M': 'Male', 'F': 'Female'})
-
-def gender_pie(df, title):
-    gender_counts = df['gender_label'].value_counts().reset_index()
+# pie chart for genders (male blue and female pink), gender_label maps M to male and F to female for visual clarity on chart
+def gender_pie(title):
+    gender_counts = counts_by(summary, 'gender_label', measure="admissions")
     gender_counts.columns = ['Gender', 'Count']
 
     chart = alt.Chart(gender_counts).mark_arc(innerRadius=50).encode(
@@ -162,176 +94,147 @@ def gender_pie(df, title):
     )
     return chart
 
-# histogram for age (bar chart looked bad)
-age_histogram = alt.Chart(df).mark_bar(color="#56B4E9").encode(
-    alt.X("age:Q", bin=alt.Bin(maxbins=20), title="Age"),
-    alt.Y("count():Q", title="Number of Patients"),
-    tooltip=["age:Q", "count():Q"]
-).properties(
-    height=400,
-    width=350,
-    title="Age Distribution of Patients"
-).configure_view(
-    stroke=None
-).configure_axis(
-    grid=False,
-    labelFontSize=16,
-    titleFontSize=18,
-    labelColor="#555",
-    titleColor="#222"
-).configure_title(
-    fontSize=18,
-    anchor='start',
-    font='Helvetica',
-    color='#333'
-)
-
-# title
-st.title("Patient Overview Dashboard")
+# histogram for age (bar chart looked bad), binned here from the admissions per age so the chart only carries the bars
+def age_histogram():
+    age_counts = counts_by(summary, "age", measure="admissions")
+    age_bins = histogram(age_counts["age"], age_counts["admissions"], bins=20)
+    age_bins.columns = ["bin_start", "bin_end", "Count"]
+    chart = alt.Chart(age_bins).mark_bar(color="#56B4E9").encode(
+        alt.X("bin_start:Q", bin="binned", title="Age"),
+        alt.X2("bin_end:Q"),
+        alt.Y("Count:Q", title="Number of Patients"),
+        tooltip=[alt.Tooltip("bin_start:Q", title="Age from"), alt.Tooltip("bin_end:Q", title="Age to"), "Count:Q"]
+    ).properties(
+        height=400,
+        width=350,
+        title="Age Distribution of Patients"
+    ).configure_view(
+        stroke=None
+    ).configure_axis(
+        grid=False,
+        labelFontSize=16,
+        titleFontSize=18,
+        labelColor="#555",
+        titleColor="#222"
+    ).configure_title(
+        fontSize=18,
+        anchor='start',
+        font='Helvetica',
+        color='#333'
+    )
+    return chart
 
-# metrics
-=======
-# Load the CSV file
-@st.cache_data
-def load_data():
-    return pd.read_csv("data.csv")
+# readmission rate per LACE band, the bands in risk order
+def readmission_bar():
+    rates = rates_by(readmits, "lace_band")
+    chart = alt.Chart(rates).mark_bar(size=40, color="#56B4E9").encode(
+        x=alt.X("lace_band:N", title="LACE Band", sort=list(lace_bands), axis=alt.Axis(labelAngle=0)),
+        y=alt.Y("rate:Q", title="Readmitted within 30 days", axis=alt.Axis(format="%")),
+        tooltip=[alt.Tooltip("lace_band:N", title="LACE Band"), "admissions:Q", "readmissions:Q",
+                 alt.Tooltip("rate:Q", title="Rate", format=".1%")]
+    ).properties(
+        height=400,
+        width=350,
+        title="30-Day Readmissions by LACE Band"
+    ).configure_view(
+        stroke=None
+    ).configure_axis(
+        grid=False,
+        labelFontSize=12,
+        titleFontSize=14,
+        labelColor="#555",
+        titleColor="#222"
+    ).configure_title(
+        fontSize=18,
+        anchor='start',
+        font='Helvetica',
+        color='#333'
+    )
+    return chart
 
-df = load_data()
+# flip axes, allow for longer labels so they dont get cut off, sort by x to show distribution better
+def horizontal_bar(group_column, title, bar_size=20):
+    return create_bar(group_column, title, bar_size).encode(
+        x=alt.X("Patient Count:Q", title="Patients"),
+        y=alt.Y(f'{group_column}:N', title=title, sort='-x', axis=alt.Axis(labelLimit=200))
+    )
 
-# Convert to numeric
-df["length_of_stay"] = pd.to_numeric(df["length_of_stay"], errors="coerce")
-df["age"] = pd.to_numeric(df["age"], errors="coerce")
-df["lace_score"] = pd.to_numeric(df["lace_score"], errors="coerce")
-df["cci_score"] = pd.to_numeric(df["cci_score"], errors="coerce")
+# two charts a row. the specs are worked out together on the shared chart pool (see chart_cache.py)
+# and each one is drawn in its place as soon as it's ready
+def show_charts(charts):
+    columns = st.columns(2)
+    slots = [columns[i % 2].empty() for i in range(len(charts))]
+    for i, spec in chart_specs(charts):
+        slots[i].vega_lite_chart(spec, use_container_width=True)
 
-# Dashboard title
-st.title("🏥 Patient Overview Dashboard")
+# title
+trace.phase("metrics")
+st.title("Patient Overview Dashboard")
 
-# basic metrics
->>>>>>> 88ddf07edf562a45d4aa0016551a44b907822a0d
+# metrics
+metrics = headline_metrics(headline)
 col1, col2, col3 = st.columns(3)
 with col1:
-    st.metric("Total Patients", df["patient_id"].nunique())
+    st.metric("Total Patients", metrics["total_patients"])
 with col2:
-    st.metric("Total Admissions", df["admission_id"].nunique())
+    st.metric("Total Admissions", metrics["total_admissions"])
 with col3:
-    st.metric("Average Length of Stay", f"{df['length_of_stay'].mean():.2f} days")
+    st.metric("Average Length of Stay", f"{metrics['avg_length_of_stay']:.2f} days")
 
 col4, col5, col6 = st.columns(3)
 with col4:
-    st.metric("Average Age", f"{df['age'].mean():.1f} years")
+    st.metric("Average Age", f"{metrics['avg_age']:.1f} years")
 with col5:
-    st.metric("Average LACE Score", f"{df['lace_score'].mean():.2f}")
+    st.metric("Average LACE Score", f"{metrics['avg_lace_score']:.2f}")
 with col6:
-    st.metric("Average CCI Score", f"{df['cci_score'].mean():.2f}")
-
-<<<<<<< HEAD
-# creating charts 
-gender_chart = gender_pie(df, 'Gender')
+    st.metric("Average CCI Score", f"{metrics['avg_cci_score']:.2f}")
 
-race_pie_chart = race_pie('race_category', 'Race')
+# readmissions to any hospital within 30 days of a discharge, see readmissions.py
+readmission_share = metrics["readmission_rate"]
+col7, col8, _ = st.columns(3)
+with col7:
+    st.metric("30-Day Readmission Rate", f"{readmission_share:.1%}" if readmission_share is not None else "n/a")
+with col8:
+    st.metric("30-Day Readmissions", metrics["readmissions"], help=f"of {metrics['readmission_admissions']} admissions")
 
-admission_type_chart = create_bar('admission_type', 'Admission Type', bar_size=30)
-
-admission_location_chart = create_bar('admission_location', 'Admission Location', bar_size=25)
-
-discharge_location_chart = create_bar('discharge_location', 'Discharge Location')
-
-length_of_stay_chart = create_bar('length_of_stay', 'Length of Stay', bar_size=7)
-
-cci_score_chart = create_bar('cci_score', 'CCI Score', bar_size=40)
-
-lace_score_chart = create_bar('lace_score', 'LACE Score', bar_size=30)
-
-hospital_chart = create_bar('Hospital', 'Hospital', bar_size=25)
-
-# flip axes, allow for longer labels so they dont get cut off, sort by x to show distribution better
-admission_type_chart = admission_type_chart.encode(
-    x=alt.X("Patient Count:Q", title="Patients"),
-    y=alt.Y('admission_type:N', title='Admission Type',sort='-x',axis=alt.Axis(labelLimit=200))
-)
-
-admission_location_chart = admission_location_chart.encode(
-    x=alt.X("Patient Count:Q", title="Patients"),
-    y=alt.Y('admission_location:N', title='Admission Location',sort='-x',axis=alt.Axis(labelLimit=200))
-)
+trace.phase("charts")
 
-discharge_location_chart = discharge_location_chart.encode(
-    x=alt.X("Patient Count:Q", title="Patients"),
-    y=alt.Y('discharge_location:N', title='Discharge Location',sort='-x',axis=alt.Axis(labelLimit=200))
-)
+# altair is imported here rather than at the top so a cold start shows the metrics without waiting for it
+import altair as alt
 
-hospital_chart = hospital_chart.encode(
-    x=alt.X("Patient Count:Q", title="Patients"),
-    y=alt.Y('Hospital:N', title='Hospital',sort='-x',axis=alt.Axis(labelLimit=200))
+# charts are drawn from the ETL's pre-aggregated summaries, not the full admissions table. only the open
+# tab's charts are built (picking another tab reruns the page), and built ones come from the spec cache
+# on later reruns (see chart_cache.py)
+summary = load_summaries()
+locations_tab, demographics_tab, details_tab = st.tabs(
+    ["Admissions and Locations", "Demographics", "Additional Details"], key="home_charts", on_change="rerun"
 )
 
-# format columns (idk how to make it look good, the odd number of charts underneath each header is awkward)
-
-col1, col2 = st.columns(2)
-with col1:
-    st.markdown("### Admissions and Locations")
-    st.altair_chart(admission_type_chart, use_container_width=True)
-    st.altair_chart(admission_location_chart, use_container_width=True)
-    st.altair_chart(discharge_location_chart, use_container_width=True)
-    st.altair_chart(hospital_chart, use_container_width=True)
-
-with col2:
-    st.markdown("### Demographics")
-    st.altair_chart(age_histogram, use_container_width=True)
-    st.altair_chart(gender_chart, use_container_width=True)
-    st.altair_chart(race_pie_chart, use_container_width=True)
-
-    st.markdown("### Additional Details")
-    st.altair_chart(length_of_stay_chart, use_container_width=True)
-    st.altair_chart(cci_score_chart, use_container_width=True)
-    st.altair_chart(lace_score_chart, use_container_width=True)
-=======
-# Function to create a bar chart for grouping by different columns
-def create_bar_chart(group_column, title):
-    group_counts = df.groupby(group_column)["patient_id"].nunique().reset_index()
-    group_counts.columns = [group_column, "Patient Count"]
-    
-    # Filter out groups with zero patients (optional)
-    group_counts = group_counts[group_counts["Patient Count"] > 0]
-    
-    # Bar chart
-    chart = alt.Chart(group_counts).mark_bar(size=15, color="#4C78A8").encode(
-        x=alt.X(f"{group_column}:N", title=title),
-        y=alt.Y("Patient Count:Q", title="Patients"),
-        tooltip=[f"{group_column}:N", "Patient Count:Q"]
-    ).properties(
-        height=300,
-        title=f"👥 Patients by {title}"
-    ).configure_view(
-        stroke=None
-    ).configure_axis(
-        grid=False
-    )
-    
-    return chart
-
-# Create the charts for each category
-age_chart = create_bar_chart('age', 'Age')
-gender_chart = create_bar_chart('gender', 'Gender')
-race_chart = create_bar_chart('race', 'Race')
-admission_type_chart = create_bar_chart('admission_type', 'Admission Type')
-admission_location_chart = create_bar_chart('admission_location', 'Admission Location')
-discharge_location_chart = create_bar_chart('discharge_location', 'Discharge Location')
-length_of_stay_chart = create_bar_chart('length_of_stay', 'Length of Stay')
-cci_score_chart = create_bar_chart('cci_score', 'CCI Score')
-lace_score_chart = create_bar_chart('lace_score', 'LACE Score')
-hospital_chart = create_bar_chart('Hospital', 'Hospital')
-
-# Display the charts using Streamlit
-st.altair_chart(age_chart, use_container_width=True)
-st.altair_chart(gender_chart, use_container_width=True)
-st.altair_chart(race_chart, use_container_width=True)
-st.altair_chart(admission_type_chart, use_container_width=True)
-st.altair_chart(admission_location_chart, use_container_width=True)
-st.altair_chart(discharge_location_chart, use_container_width=True)
-st.altair_chart(length_of_stay_chart, use_container_width=True)
-st.altair_chart(cci_score_chart, use_container_width=True)
-st.altair_chart(lace_score_chart, use_container_width=True)
-st.altair_chart(hospital_chart, use_container_width=True)
->>>>>>> 88ddf07edf562a45d4aa0016551a44b907822a0d
+if locations_tab.open:
+    with locations_tab:
+        show_charts([
+            partial(chart_spec, horizontal_bar, 'admission_type', 'Admission Type', bar_size=30, data=summary),
+            partial(chart_spec, horizontal_bar, 'admission_location', 'Admission Location', bar_size=25, data=summary),
+            partial(chart_spec, horizontal_bar, 'discharge_location', 'Discharge Location', data=summary),
+            partial(chart_spec, horizontal_bar, 'Hospital', 'Hospital', bar_size=25, data=summary),
+        ])
+
+if demographics_tab.open:
+    with demographics_tab:
+        show_charts([
+            partial(chart_spec, age_histogram, data=summary),
+            partial(chart_spec, gender_pie, 'Gender', data=summary),
+            partial(chart_spec, race_pie, 'race_category', 'Race', data=summary),
+        ])
+
+if details_tab.open:
+    with details_tab:
+        readmits = load_readmissions()
+        show_charts([
+            partial(chart_spec, create_bar, 'length_of_stay', 'Length of Stay', bar_size=7, data=summary),
+            partial(chart_spec, create_bar, 'cci_score', 'CCI Score', bar_size=40, data=summary),
+            partial(chart_spec, create_bar, 'lace_score', 'LACE Score', bar_size=30, data=summary),
+            partial(chart_spec, readmission_bar, data=readmits),
+        ])
+
+debug_panel.show(trace)
@@ -0,0 +1,263 @@
+import argparse
+import contextlib
+import gc
+import io
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # windows, no process peak
+    resource = None
+
+import ETL
+import data_loader
+from binning import histogram
+from census import Census
+from chart_cache import chart_cache
+from distinct import DistinctCounts
+from filters import FilterMasks
+from headline import headline_file, load_headline
+from instrumentation import Trace
+from pagination import page_positions
+from patient_index import PatientIndex
+from readmissions import intervals, rate_dimensions, rate_table, rates_by, readmission_rates
+from shared_frame import attach_frame, pa, publish_frame
+from star_schema import compact_admissions, load_admissions, read_partition, read_table, write_partitions
+from summaries import (
+    all_hospitals, build_summaries, count_columns, counts_by, hospital_metrics, hospitals, summary_tables
+)
+from synthetic_data import generate
+from trends import Trends, grains, rollups, trend_table
+
+# times the ETL and the dashboard's load, chart and filter paths on synthetic data of a given size,
+# and appends wall time and peak memory per stage to bench_output.txt with the commit they ran on.
+# the same --rows and --seed always generate the same data, so runs on different commits compare
+
+root = os.path.dirname(os.path.abspath(__file__))
+results_file = os.path.join(root, "bench_output.txt")
+pages = ["Home.py", "pages/Hospitals.py", "pages/Patients.py", "pages/Trends.py"]
+
+
+class Benchmark:
+    # best wall time of `repeat` runs and the highest peak memory growth of any of them, per stage
+    # (each run is an instrumentation.Trace, so memory is sampled the same way as in the ETL/page traces)
+    def __init__(self, repeat=3):
+        self.repeat = repeat
+        self.results = []  # (stage, seconds, bytes)
+
+    def time(self, stage, run, repeat=None):
+        best, peak, value = float("inf"), 0, None
+        for _ in range(repeat or self.repeat):
+            value = None  # the previous run's result is freed before the next one
+            gc.collect()
+            trace = Trace(stage)
+            start = time.perf_counter()
+            try:
+                value = run()
+            finally:
+                elapsed = time.perf_counter() - start
+                trace.finish()
+                growth = trace.peak - trace.rss
+            best, peak = min(best, elapsed), max(peak, growth)
+        self.results.append((stage, best, peak))
+        return value
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def quiet(run):
+    # the ETL and the loaders print progress, which would get mixed into the results
+    def wrapped():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return run()
+    return wrapped
+
+
+def source_data(args, rows, bench):
+    # generated once per size and seed and kept in --data-dir for later runs
+    os.makedirs(args.data_dir, exist_ok=True)
+    path = os.path.join(args.data_dir, f"admissions-{rows}-seed{args.seed}.csv")
+    if not os.path.exists(path):
+        bench.time("generate source", lambda: generate(path, rows, args.seed), repeat=1)
+    return path
+
+
+def bench_etl(bench, source, output, fmt, args):
+    options = ["--source", source, "--output-dir", output, "--format", fmt]
+    if args.chunksize:
+        options += ["--chunksize", str(args.chunksize)]
+    etl_args = ETL.build_parser().parse_args(options)
+
+    def parse():
+        for _ in ETL.read_source(source, chunksize=args.chunksize):
+            pass
+
+    def key_lookup():
+        keys = {name: ETL.DimensionKeys(columns, key) for name, (columns, key) in ETL.dimensions.items()}
+        for chunk, members in ETL.prepared_chunks([(source, 0)], 1, args.chunksize):
+            ETL.build_fact_rows(chunk, members, keys)
+
+    def full_build():
+        shutil.rmtree(output, ignore_errors=True)
+        ETL.build(etl_args)
+
+    bench.time(f"etl {fmt}: parse source", parse)
+    bench.time(f"etl {fmt}: parse + dimension keys", key_lookup)
+    bench.time(f"etl {fmt}: full build", quiet(full_build))
+
+    # the steps the full build does chunk by chunk, each on the whole merged output
+    admissions = bench.time(f"etl {fmt}: reload + merge", lambda: load_admissions(output))
+    bench.time(f"etl {fmt}: summaries", lambda: build_summaries(admissions))
+    bench.time(f"etl {fmt}: distinct counts", lambda: DistinctCounts.build(admissions))
+    bench.time(f"etl {fmt}: trend rollups", lambda: rollups(admissions))
+    bench.time(f"etl {fmt}: readmissions", lambda: readmission_rates(intervals(admissions)))
+    scratch = output + "-partitions"
+    bench.time(f"etl {fmt}: partitions", lambda: write_partitions(admissions[ETL.fact_columns], scratch, fmt))
+    shutil.rmtree(scratch, ignore_errors=True)
+
+
+def bench_dashboard(bench, output, fmt):
+    # the load paths and the aggregations behind every chart, page by page
+    bench.time(f"load {fmt}: headline", lambda: load_headline(os.path.join(output, headline_file)))
+    admissions = bench.time(f"load {fmt}: star schema + merge", lambda: load_admissions(output))
+    df = bench.time(f"load {fmt}: compact", lambda: compact_admissions(admissions)[0])
+    del admissions
+    if pa is not None:
+        # the multi-worker mode: publishing the compact frame once, and attaching it in each process
+        shared = tempfile.mkdtemp(prefix="dashboard-benchmark-shared-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        bench.time(f"load {fmt}: publish shared frame", lambda: publish_frame(df, shared, "benchmark"))
+        bench.time(f"load {fmt}: attach shared frame", lambda: attach_frame(shared))
+        shutil.rmtree(shared, ignore_errors=True)
+    summary = bench.time(f"load {fmt}: summary tables",
+                         lambda: {name: read_table(name, output) for name in summary_tables})
+    keys = [all_hospitals] + sorted(hospitals(summary).values())
+
+    def summary_charts():
+        for hospital_key in keys:
+            hospital_metrics(summary, hospital_key)
+            for column in count_columns:
+                counts_by(summary, column, hospital_key)
+            ages = counts_by(summary, "age", hospital_key, measure="admissions")
+            histogram(ages["age"], ages["admissions"], bins=20)
+
+    bench.time(f"charts {fmt}: Home/Hospitals counts + metrics", summary_charts)
+
+    trends = Trends(read_table(trend_table, output))
+
+    def trend_charts():
+        for grain in grains:
+            trends.series(all_hospitals, grain, window=7, max_points=1000)
+
+    bench.time(f"charts {fmt}: trend series", trend_charts)
+
+    rates = read_table(rate_table, output)
+    bench.time(f"charts {fmt}: readmission rates",
+               lambda: [rates_by(rates, dimension, key) for key in keys for dimension in rate_dimensions])
+
+    busiest = df["hospital_key"].value_counts().idxmax()
+
+    def build_census():
+        stays = read_partition(output, busiest, columns=["admittime", "dischtime"])
+        return Census(stays["admittime"], stays["dischtime"])
+
+    census = bench.time(f"charts {fmt}: census build", build_census)
+    bench.time(f"charts {fmt}: census daily", census.daily)
+
+    masks = bench.time(f"filters {fmt}: build masks", lambda: FilterMasks(df))
+    index = bench.time(f"filters {fmt}: build id index", lambda: PatientIndex(df["patient_id"]))
+    every_filter = ["complete", "high_lace_score", "high_cci_score", "high_length_of_stay"]
+    rows = bench.time(f"filters {fmt}: all filters", lambda: masks.select(every_filter))
+    bench.time(f"filters {fmt}: id prefix search", lambda: masks.select(every_filter, index.search("1000")))
+    bench.time(f"filters {fmt}: sort one page", lambda: page_positions(df, rows, "lace_score", False, 1, 50))
+
+
+def bench_pages(bench, output, fmt):
+    # full script runs of each page, cold (nothing loaded, as after a restart) and warm (a rerun)
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("streamlit's AppTest isn't available, skipping page runs")
+        return
+
+    data_loader.output_dir = output
+    for page in pages:
+        def cold():
+            with data_loader._lock:
+                data_loader._cache.clear()
+                data_loader._hospitals.clear()
+            chart_cache.clear()
+            return AppTest.from_file(os.path.join(root, page), default_timeout=3600).run()
+
+        app = bench.time(f"page {fmt}: {page} cold", quiet(cold), repeat=1)
+        if app.exception:
+            print(f"{page} failed: {app.exception[0].message}")
+            continue
+        bench.time(f"page {fmt}: {page} rerun", quiet(app.run))
+
+
+def report(bench, header):
+    lines = [header, f"{'stage':<48}{'wall_s':>12}{'peak_mb':>10}"]
+    lines += [f"{stage:<48}{seconds:>12.4f}{memory / 2**20:>10.1f}" for stage, seconds, memory in bench.results]
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        lines.append(f"{'process peak rss':<48}{'':>12}{(peak if sys.platform == 'darwin' else peak * 1024) / 2**20:>10.1f}")
+    text = "\n".join(lines) + "\n\n"
+    print(text, end="")
+    with open(results_file, "a") as f:
+        f.write(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ETL and dashboard paths on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000],
+                        help="admissions to benchmark with, one run per size (10000 to 10000000)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the fastest is reported")
+    parser.add_argument("--formats", nargs="+", default=["csv"], choices=list(ETL.formats),
+                        help="ETL output formats to benchmark")
+    parser.add_argument("--chunksize", type=int, default=None, help="ETL --chunksize")
+    parser.add_argument("--no-pages", action="store_true", help="skip the full page runs")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "dashboard-benchmark"),
+                        help="where generated source data is kept between runs")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    for rows in args.rows:
+        bench = Benchmark(args.repeat)
+        source = source_data(args, rows, bench)
+        work = tempfile.mkdtemp(prefix="dashboard-benchmark-")
+        try:
+            for fmt in args.formats:
+                output = os.path.join(work, fmt)
+                bench_etl(bench, source, output, fmt, args)
+                bench_dashboard(bench, output, fmt)
+                if not args.no_pages:
+                    bench_pages(bench, output, fmt)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+        report(bench, f"# {datetime.now():%Y-%m-%d %H:%M:%S} commit {commit} rows {rows} seed {args.seed} "
+                      f"repeat {args.repeat} formats {','.join(args.formats)} chunksize {args.chunksize} | "
+                      f"python {platform.python_version()} pandas {pd.__version__} numpy {np.__version__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# histograms binned here instead of in the browser, so a chart only carries one row per bar
+
+
+def _nice_step(span, maxbins):
+    # the step vega-lite picks for bin=alt.Bin(maxbins=...): a power of ten, halved or fifthed
+    # as long as that still gives no more than maxbins bins, so the bars look the same as before
+    if span <= 0:
+        return 1.0
+    level = math.ceil(math.log10(maxbins))
+    step = 10.0 ** (round(math.log10(span)) - level)
+    while math.ceil(span / step) > maxbins:
+        step *= 10
+    for divisor in (5, 2):
+        if span / (step / divisor) <= maxbins:
+            step /= divisor
+    return step
+
+
+def _weighted_quantiles(values, weights, quantiles):
+    order = np.argsort(values, kind="stable")
+    values, weights = values[order], weights[order]
+    cumulative = np.cumsum(weights)
+    positions = (cumulative - weights / 2) / cumulative[-1]
+    return np.interp(quantiles, positions, values)
+
+
+def histogram(values, weights=None, bins=20, method="width"):
+    # counts per bin of `values`, as bin_start, bin_end, count rows.
+    # method="width" gives equal, nicely rounded bins (at most `bins` of them),
+    # method="quantile" gives `bins` bins holding about the same count each.
+    # weights are per value counts, e.g. the admissions per age from the summaries
+    values = np.asarray(values, dtype=float)
+    whole = weights is None or np.issubdtype(np.asarray(weights).dtype, np.integer)
+    weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float)
+    keep = np.isfinite(values)
+    values, weights = values[keep], weights[keep]
+    if not len(values):
+        return pd.DataFrame({"bin_start": [], "bin_end": [], "count": []})
+
+    low, high = values.min(), values.max()
+    if method == "quantile":
+        edges = np.unique(_weighted_quantiles(values, weights, np.linspace(0, 1, bins + 1)))
+        edges[0], edges[-1] = low, high
+        if len(edges) < 2:
+            edges = np.array([low, low + 1])
+    elif method == "width":
+        step = _nice_step(high - low, bins)
+        start = math.floor(low / step) * step
+        stop = max(math.ceil(high / step) * step, start + step)
+        # values on the last edge go in the last bin, like vega's
+        edges = start + step * np.arange(round((stop - start) / step) + 1)
+    else:
+        raise ValueError(f"unknown binning method {method!r}, expected 'width' or 'quantile'")
+
+    counts, edges = np.histogram(values, edges, weights=weights)
+    if whole:
+        counts = counts.astype(np.int64)
+    return pd.DataFrame({"bin_start": edges[:-1], "bin_end": edges[1:], "count": counts})
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+_hour = np.timedelta64(1, "h")
+_day = np.timedelta64(1, "D")
+
+_still_admitted = np.iinfo(np.int64).max  # discharge time of admissions without one
+
+
+def _nanoseconds(times):
+    return pd.to_datetime(pd.Series(times)).to_numpy("datetime64[ns]").astype(np.int64)
+
+
+class Census:
+    # inpatient census of one hospital from its admissions' admit and discharge times.
+    # admits and discharges are kept as two sorted arrays, so the census at any set of times is
+    # two binary searches per time, and the peaks come from one sweep over the sorted +1/-1 events.
+    # nothing is expanded per day of stay, a 60 day stay costs the same as a 1 day one
+    def __init__(self, admittime, dischtime):
+        admit = pd.to_datetime(pd.Series(admittime)).reset_index(drop=True)
+        discharge = pd.to_datetime(pd.Series(dischtime)).reset_index(drop=True)
+        keep = admit.notna().to_numpy()
+        admit = _nanoseconds(admit[keep])
+        missing = discharge[keep].isna().to_numpy()
+        discharge = _nanoseconds(discharge[keep])
+        discharge[missing] = _still_admitted
+        discharge = np.maximum(discharge, admit)  # a discharge recorded before the admit counts as no stay
+
+        self.admits = np.sort(admit)
+        self.discharges = np.sort(discharge)
+
+        # every admit and discharge in time order, discharges first at the same instant,
+        # with the census right after each of them
+        times = np.concatenate([self.discharges, self.admits])
+        deltas = np.concatenate([np.full(len(self.discharges), -1), np.ones(len(self.admits), dtype=np.int64)])
+        order = np.lexsort((deltas, times))
+        self.event_times = times[order]
+        self.running = np.cumsum(deltas[order])
+
+    def at(self, times):
+        # patients in hospital at each of `times` (datetime64 values), admits and discharges at that instant included
+        times = np.asarray(times, dtype="datetime64[ns]").astype(np.int64)
+        return (np.searchsorted(self.admits, times, side="right")
+                - np.searchsorted(self.discharges, times, side="right"))
+
+    def span(self):
+        # first and last day with anyone in hospital, None without admissions
+        if not len(self.admits):
+            return None
+        discharged = self.discharges[self.discharges != _still_admitted]
+        last = max(self.admits[-1], discharged[-1] if len(discharged) else self.admits[-1])
+        return (np.datetime64(int(self.admits[0]), "ns").astype("datetime64[D]"),
+                np.datetime64(int(last), "ns").astype("datetime64[D]"))
+
+    def daily(self, start=None, end=None):
+        # census at midnight and the highest census during each day from start to end (dates)
+        span = self.span()
+        if span is None:
+            return pd.DataFrame({"date": pd.to_datetime([]), "census": [], "peak": []})
+        first = np.datetime64(pd.Timestamp(start).date(), "D") if start is not None else span[0]
+        last = np.datetime64(pd.Timestamp(end).date(), "D") if end is not None else span[1]
+        days = np.arange(first, last + _day, _day)
+        midnights = days.astype("datetime64[ns]")
+        census = self.at(midnights)
+
+        # peak of each day: the midnight census, or the census after any event during the day if higher.
+        # days are contiguous, so the events of the days with any follow each other in event_times
+        bounds = np.searchsorted(self.event_times, np.append(midnights, midnights[-1:] + _day).astype(np.int64))
+        peak = census.copy()
+        busy = np.flatnonzero(bounds[1:] > bounds[:-1])
+        if len(busy):
+            event_peaks = np.maximum.reduceat(self.running[:bounds[busy[-1] + 1]], bounds[busy])
+            peak[busy] = np.maximum(peak[busy], event_peaks)
+        return pd.DataFrame({"date": midnights, "census": census, "peak": peak})
+
+    def hourly(self, start, end):
+        # census on the hour from start to end (dates, end included)
+        first = np.datetime64(pd.Timestamp(start).date(), "D").astype("datetime64[h]")
+        last = (np.datetime64(pd.Timestamp(end).date(), "D") + _day).astype("datetime64[h]")
+        hours = np.arange(first, last, _hour).astype("datetime64[ns]")
+        return pd.DataFrame({"time": hours, "census": self.at(hours)})
+
+    def peak(self):
+        # highest census ever and when it was first reached
+        if not len(self.running):
+            return 0, None
+        i = int(np.argmax(self.running))
+        return int(self.running[i]), pd.Timestamp(int(self.event_times[i]))
@@ -0,0 +1,168 @@
+import copy
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from instrumentation import attach, current, span
+
+# vega-lite specs of the dashboard charts, shared by every rerun and every session.
+# a chart is keyed on the function that builds it, its arguments and a fingerprint of
+# the data it reads, so a rerun that changes none of them skips both the pandas work
+# and altair's validation/serialisation and just sends the stored spec
+
+# most rows a chart may embed; every row is sent to the browser as inline json, so anything
+# bigger should be aggregated first (see binning.py) rather than plotted row by row
+max_inline_rows = 5000
+
+# altair takes a good part of a second to import, so it's only imported for the first chart
+# that isn't in the cache, after the page's metrics are on screen
+alt = None
+_themes = None
+_import_lock = threading.Lock()
+
+# altair's theme and data transformer are process wide settings, switched on around each
+# to_dict(); serialising is the only part of a chart build that has to hold this
+_serialise_lock = threading.Lock()
+
+# chart specs of a page are built on one pool shared by every session, so a burst of users
+# queues up behind a fixed number of threads instead of each rerun starting its own
+chart_workers = min(4, os.cpu_count() or 1)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _guarded_values(data, max_rows=max_inline_rows, oversize="raise"):
+    # altair data transformer; too large a frame is refused, or with oversize="sample"
+    # cut down to a random max_rows of its rows (same rows every time)
+    if isinstance(data, pd.DataFrame) and len(data) > max_rows:
+        if oversize != "sample":
+            raise alt.MaxRowsError(
+                f"chart data has {len(data)} rows, more than the {max_rows} allowed inline; aggregate it first"
+            )
+        data = data.sample(n=max_rows, random_state=0).sort_index()
+    return alt.utils.data.to_values(data)
+
+
+def _import_altair():
+    global alt, _themes
+    with _import_lock:
+        if alt is None:
+            with span("import altair"):
+                import altair
+            altair.data_transformers.register("guarded", _guarded_values)
+            _themes = altair.theme if hasattr(altair, "theme") else altair.themes  # alt.themes before altair 5.5
+            alt = altair
+    return alt
+
+
+# id(frame) -> (weak reference, fingerprint). frames from data_loader are never modified, so each
+# one is only hashed once; frames aren't hashable, hence the id and the check that it's still the same frame
+_fingerprints = {}
+
+
+def _forget(ref, frame_id):
+    if _fingerprints.get(frame_id, (None,))[0] is ref:
+        del _fingerprints[frame_id]
+
+
+def fingerprint(data):
+    if isinstance(data, dict):
+        return tuple((name, fingerprint(value)) for name, value in sorted(data.items()))
+    if isinstance(data, pd.DataFrame):
+        frame_id = id(data)
+        entry = _fingerprints.get(frame_id)
+        if entry is None or entry[0]() is not data:
+            hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+            ref = weakref.ref(data, lambda ref: _forget(ref, frame_id))
+            entry = _fingerprints[frame_id] = (ref, (tuple(data.columns), hashlib.sha1(hashes.tobytes()).hexdigest()))
+        return entry[1]
+    return data
+
+
+class ChartCache:
+    def __init__(self, max_size=64, max_rows=max_inline_rows, oversize="raise"):
+        self.max_size = max_size
+        self.max_rows = max_rows
+        self.oversize = oversize
+        self.hits = 0
+        self.misses = 0
+        self._specs = OrderedDict()  # key -> spec, least recently used first
+        self._lock = threading.Lock()
+
+    def spec(self, build, *args, data=None, **kwargs):
+        # build(*args, **kwargs) must return an altair chart and depend only on its arguments and `data`.
+        # scripts are re-executed on every rerun, so functions are told apart by their code, not identity
+        key = (build.__code__.co_filename, build.__code__, args, tuple(sorted(kwargs.items())), fingerprint(data))
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is not None:
+                self.hits += 1
+                self._specs.move_to_end(key)
+            else:
+                self.misses += 1
+        if spec is None:
+            # built outside the lock so charts can be worked out in parallel; two sessions asking for
+            # the same new chart at once may both build it, the specs are the same
+            _import_altair()
+            with span(f"chart {build.__name__}"):
+                chart = build(*args, **kwargs)
+                # no altair theme, like st.altair_chart, so the charts look the same as before
+                with _serialise_lock, span("serialise"), _themes.enable("none"), \
+                        alt.data_transformers.enable("guarded", max_rows=self.max_rows, oversize=self.oversize):
+                    spec = chart.to_dict()
+            with self._lock:
+                self._specs[key] = spec
+                while len(self._specs) > self.max_size:
+                    self._specs.popitem(last=False)
+        # streamlit adds its own settings to the spec it's given, the stored one stays untouched
+        return copy.deepcopy(spec)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._specs), "max_size": self.max_size}
+
+    def clear(self):
+        with self._lock:
+            self._specs.clear()
+
+
+chart_cache = ChartCache()
+
+
+def chart_spec(build, *args, data=None, **kwargs):
+    return chart_cache.spec(build, *args, data=data, **kwargs)
+
+
+def _traced(trace, task):
+    # the spans of a pooled task go in the trace of the rerun that submitted it
+    attach(trace)
+    try:
+        return task()
+    finally:
+        attach(None)
+
+
+def chart_specs(tasks):
+    # runs each task (a no argument callable returning a spec, e.g. a partial of chart_spec) on the
+    # shared pool and yields (position, spec) as each one finishes, for the page to draw it in its place.
+    # an error is raised when its chart comes up; the tasks not started yet are then dropped
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=chart_workers, thread_name_prefix="chart")
+    trace = current()
+    positions = {_pool.submit(_traced, trace, task): position for position, task in enumerate(tasks)}
+    try:
+        pending = set(positions)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=positions.get):
+                yield positions[future], future.result()
+    finally:
+        for future in positions:
+            future.cancel()
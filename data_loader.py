@@ -0,0 +1,384 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from census import Census
+from database import SQLSummaries, database_files, database_path
+from distinct import DistinctCounts, distinct_file
+from filters import FilterMasks
+from headline import build_headline, headline_file, load_headline as read_headline
+from instrumentation import attach, current, span
+from patient_index import PatientIndex
+from readmissions import intervals, rate_table, readmission_rates
+from shared_frame import attach_frame, publish_frame, shared_version
+from star_schema import (
+    compact_admissions, current_dir, load_admissions, load_hospital_admissions, read_partition, read_table, table_path, tables
+)
+from summaries import build_summaries, required_columns, summary_tables
+from trends import Trends, rollups, trend_table
+
+output_dir = "etl_output"  # folder where your ETL output is saved
+
+# where the Home and Hospitals numbers come from: "tables" reads the ETL's summary tables,
+# "sqlite"/"duckdb" query the database written by ETL.py --database on every new question.
+# set with DASHBOARD_BACKEND
+backend = os.environ.get("DASHBOARD_BACKEND", "tables")
+if backend != "tables" and backend not in database_files:
+    raise ValueError(f"DASHBOARD_BACKEND must be tables or one of {', '.join(database_files)}, not {backend!r}")
+
+# multi-worker mode: with several Streamlit processes on one host, set DASHBOARD_SHARED_DIR (e.g.
+# /dev/shm/patient-dashboard) for all of them and run shared_loader.py next to them. the loader
+# publishes the admissions frame there once per ETL output and load_data() maps it read-only
+# instead of every process loading a copy. a process waits up to shared_wait seconds for the
+# loader to catch up with a new ETL output, then loads the frame itself
+shared_dir = os.environ.get("DASHBOARD_SHARED_DIR")
+shared_wait = 60
+
+# one merged frame (and one set of summaries) per process, shared by every rerun and every session.
+# they are keyed on the content of the ETL output so a new ETL run is picked up
+# on the next rerun, but an untouched file is never parsed twice
+_cache = {}  # name -> (version, value)
+_file_hashes = {}  # path -> ((mtime, size), sha1), so files are only re-hashed after they change
+_lock = threading.RLock()
+
+# when the ETL output changes the new values are built in a background thread while every
+# session keeps getting the previous ones, and swapped in once they're complete
+_refreshes = {}  # name -> _Refresh in progress
+_local = threading.local()  # .refreshing is set in refresh threads
+
+# single hospital slices and census for the Hospitals page, least recently used first; only the
+# last few hospitals looked at are kept, so memory doesn't grow with the number of sites
+hospital_cache_size = 8
+_hospitals = OrderedDict()  # (kind, hospital_key) -> (version, value)
+
+# memory of the merged frame last loaded, before and after compact_admissions, in bytes,
+# and whether it's the shared copy (both sizes are then the size of the mapped file)
+memory_report = {}  # "before", "after", "shared"
+
+logger = logging.getLogger(__name__)
+
+
+def _file_hash(path):
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _file_hashes.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    _file_hashes[path] = (stamp, sha1.hexdigest())
+    return sha1.hexdigest()
+
+
+def data_version():
+    # fingerprint of the ETL output files; changes whenever any of them is rewritten.
+    # parquet/arrow files are preferred over csv when the ETL wrote them.
+    # a published version (ETL.py --publish) is never modified, its paths alone identify it
+    data_dir = current_dir(output_dir)
+    published = data_dir != output_dir
+    return tuple(
+        (name, path, None if published else _file_hash(path))
+        for name in tables
+        for path in [table_path(name, data_dir)]
+    )
+
+
+def _version_dir(version):
+    return os.path.dirname(dict((name, path) for name, path, _ in version)["fact_admissions"])
+
+
+class _Refresh(threading.Thread):
+    def __init__(self, name, build, version, store):
+        super().__init__(name=f"refresh-{name}", daemon=True)
+        self.key = name
+        self.build = build
+        self.version = version
+        self.store = store  # store(version, value) swaps the new value in, called under _lock
+        self.value = None
+        self.error = None
+        self.trace = current()  # the first load's time counts towards the rerun waiting for it
+
+    def run(self):
+        _local.refreshing = True
+        if self.trace is not None:
+            attach(self.trace)
+        try:
+            with span(f"load {self.key}"):
+                self.value = self.build(self.version)
+        except BaseException as error:
+            self.error = error
+        with _lock:
+            # a refresh replaced by one for a newer version leaves the cache to it; storing its older
+            # value could overwrite the newer one if it finished first
+            if _refreshes.get(self.key) is self:
+                if self.error is None:
+                    self.store(self.version, self.value)
+                del _refreshes[self.key]  # a failed refresh is tried again on the next call
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def _refreshed(name, build, entry, store):
+    # entry() is the cached (version, value) or None. a stale value is returned while a _Refresh
+    # builds the current one, outside _lock, so a slow load never holds up other sessions
+    with _lock:
+        version = data_version()
+        cached = entry()
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        refresh = _refreshes.get(name)
+        if refresh is None or refresh.version != version:
+            refresh = _refreshes[name] = _Refresh(name, build, version, store)
+            refresh.start()
+    # the first load has nothing to show meanwhile, and a refresh building on this value needs the new one
+    if cached is None or getattr(_local, "refreshing", False):
+        return refresh.result()
+    return cached[1]
+
+
+def _cached(name, build):
+    def store(version, value):
+        _cache[name] = (version, value)
+    return _refreshed(name, build, lambda: _cache.get(name), store)
+
+
+def _build_summaries(version):
+    # the ETL writes the summary tables after the star schema; if they're missing or older than the
+    # fact table (output of an older ETL) they are worked out here from the merged frame instead
+    data_dir = _version_dir(version)
+    fact_path = dict((name, path) for name, path, _ in version)["fact_admissions"]
+    try:
+        paths = {name: table_path(name, data_dir) for name in summary_tables}
+    except FileNotFoundError:
+        paths = None
+    if paths and all(os.stat(path).st_mtime_ns >= os.stat(fact_path).st_mtime_ns for path in paths.values()):
+        return {name: read_table(name, data_dir, path) for name, path in paths.items()}
+    return build_summaries(load_data())
+
+
+def _build_query_backend(version):
+    # the database is used when it's at least as new as the fact table, else the summary tables
+    fact_path = dict((name, path) for name, path, _ in version)["fact_admissions"]
+    path = database_path(_version_dir(version), backend)
+    if os.path.exists(path) and os.stat(path).st_mtime_ns >= os.stat(fact_path).st_mtime_ns:
+        return SQLSummaries(path, backend)
+    return _build_summaries(version)
+
+
+def _build_trends(version):
+    # the ETL's trend rollups, or worked out from the merged frame for output of an older ETL
+    data_dir = _version_dir(version)
+    fact_path = dict((name, path) for name, path, _ in version)["fact_admissions"]
+    try:
+        path = table_path(trend_table, data_dir)
+    except FileNotFoundError:
+        path = None
+    if path and os.stat(path).st_mtime_ns >= os.stat(fact_path).st_mtime_ns:
+        return Trends(read_table(trend_table, data_dir, path))
+    return Trends(rollups(load_data()))
+
+
+def _build_readmissions(version):
+    # the ETL's readmission counts, or worked out from the merged frame for output of an older ETL
+    data_dir = _version_dir(version)
+    fact_path = dict((name, path) for name, path, _ in version)["fact_admissions"]
+    try:
+        path = table_path(rate_table, data_dir)
+    except FileNotFoundError:
+        path = None
+    if path and os.stat(path).st_mtime_ns >= os.stat(fact_path).st_mtime_ns:
+        return read_table(rate_table, data_dir, path)
+    return readmission_rates(intervals(load_data()))
+
+
+def _build_distinct_counts(version):
+    fact_path = dict((name, path) for name, path, _ in version)["fact_admissions"]
+    path = os.path.join(_version_dir(version), distinct_file)
+    if os.path.exists(path) and os.stat(path).st_mtime_ns >= os.stat(fact_path).st_mtime_ns:
+        return DistinctCounts.load(path)
+    return DistinctCounts.build(load_data())
+
+
+def _build_headline(version):
+    # the ETL's headline numbers, or worked out from the summaries and readmissions for output of an older ETL
+    fact_path = dict((name, path) for name, path, _ in version)["fact_admissions"]
+    path = os.path.join(_version_dir(version), headline_file)
+    if os.path.exists(path) and os.stat(path).st_mtime_ns >= os.stat(fact_path).st_mtime_ns:
+        return read_headline(path)
+    return build_headline(load_summaries(), load_readmissions())
+
+
+def _compact(df):
+    with span("compact"):
+        df, (before, after) = compact_admissions(df)
+    memory_report.update(before=before, after=after, shared=False)
+    logger.info("admissions frame: %d rows, %.1f MB -> %.1f MB", len(df), before / 2**20, after / 2**20)
+    return df
+
+
+def _load_admissions(version):
+    return _compact(load_admissions(_version_dir(version), {name: path for name, path, _ in version}))
+
+
+def _version_key(version):
+    # names an ETL output the same way in every process reading it, whatever its output_dir is called
+    parts = [(name, os.path.relpath(path, output_dir), file_hash) for name, path, file_hash in version]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _attach_shared(version):
+    # the loader's copy of this ETL output's frame; loaded here instead if nothing was ever
+    # published (no loader running) or the loader hasn't caught up within shared_wait seconds
+    key = _version_key(version)
+    deadline = time.monotonic() + shared_wait
+    with span("attach shared frame"):
+        while True:
+            published = shared_version(shared_dir)
+            if published == key:
+                attached = attach_frame(shared_dir)
+                if attached is not None and attached[1] == key:  # not replaced in between
+                    df, _, size = attached
+                    memory_report.update(before=size, after=size, shared=True)
+                    logger.info("admissions frame: %d rows, %.1f MB mapped from %s", len(df), size / 2**20, shared_dir)
+                    return df
+            elif published is None or time.monotonic() >= deadline:
+                break
+            time.sleep(0.5)
+    logger.warning("no admissions frame for the current ETL output in %s, loading it in this process", shared_dir)
+    return _load_admissions(version)
+
+
+def publish_shared(target, keep=2):
+    # loader side of the multi-worker mode (see shared_loader.py): publishes the admissions frame of the
+    # current ETL output to `target` unless it's there already. returns the new version's name, or None
+    version = data_version()
+    key = _version_key(version)
+    if shared_version(target) == key:
+        return None
+    return publish_frame(_load_admissions(version), target, key, keep)
+
+
+class AdmissionsFrame:
+    # the merged frame with the objects built over its rows for the Patients page. they're built on
+    # first use and cached with the frame, and a new ETL output swaps all of them in at once, so a
+    # rerun never pairs a new frame with the previous frame's masks or index
+    builds = {
+        "filter_masks": FilterMasks,
+        "patient_index": lambda df: PatientIndex(df["patient_id"]),
+    }
+
+    def __init__(self, df):
+        self.df = df
+        self._built = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name):
+        with self._lock:
+            if name not in self._built:
+                with span(f"load {name}"):
+                    self._built[name] = self.builds[name](self.df)
+            return self._built[name]
+
+    def filter_masks(self):
+        # per filter bitmasks over the rows of df, see filters.py
+        return self._get("filter_masks")
+
+    def patient_index(self):
+        # patient id search index over the rows of df, see patient_index.py
+        return self._get("patient_index")
+
+
+def _load_frame(version):
+    frame = AdmissionsFrame(_attach_shared(version) if shared_dir else _load_admissions(version))
+    # whatever the previous frame had built is built for this one too, before it's swapped in
+    previous = _cache.get("admissions")
+    if previous is not None:
+        for name in list(previous[1]._built):
+            frame._get(name)
+    return frame
+
+
+def load_frame():
+    # the frame with its filter masks and patient index; a page using more than the frame takes
+    # all of them from the one object this returns
+    return _cached("admissions", _load_frame)
+
+
+def load_data():
+    # the returned frame is shared between sessions, so pages must not modify it in place
+    # (with shared_dir set its columns are read-only memory shared with the other processes)
+    return load_frame().df
+
+
+def load_summaries():
+    # small pre-aggregated tables the charts and metrics are drawn from, see summaries.py,
+    # or with a database backend an object answering the same questions with queries
+    return _cached("summaries", _build_summaries if backend == "tables" else _build_query_backend)
+
+
+def load_headline():
+    # hospital names and the metrics at the top of the Home and Hospitals pages, see headline.py
+    return _cached("headline", _build_headline)
+
+
+def load_trends():
+    # admissions, length of stay and LACE over time, see trends.py
+    return _cached("trends", _build_trends)
+
+
+def load_readmissions():
+    # 30 day readmission counts per hospital, diagnosis and LACE band, see readmissions.py
+    return _cached("readmissions", _build_readmissions)
+
+
+def load_distinct_counts():
+    # per group patient sets and sketches for counting unique patients across hospitals, see distinct.py
+    return _cached("distinct_counts", _build_distinct_counts)
+
+
+def _cached_hospital(kind, hospital_key, build):
+    key = (kind, hospital_key)
+
+    def entry():
+        cached = _hospitals.get(key)
+        if cached is not None:
+            _hospitals.move_to_end(key)
+        return cached
+
+    def store(version, value):
+        _hospitals[key] = (version, value)
+        _hospitals.move_to_end(key)
+        while len(_hospitals) > hospital_cache_size:
+            _hospitals.popitem(last=False)
+
+    return _refreshed(f"{kind} {hospital_key}", build, entry, store)
+
+
+def load_hospital(hospital_key):
+    # one hospital's complete admissions (no gaps in length of stay, age, LACE or CCI), read from its
+    # partition of the ETL output instead of filtering load_data(). shared between sessions like load_data()
+    def build(version):
+        paths = {name: path for name, path, _ in version}
+        df = load_hospital_admissions(_version_dir(version), hospital_key, paths).dropna(subset=required_columns)
+        return compact_admissions(df.reset_index(drop=True))[0]
+    return _cached_hospital("admissions", hospital_key, build)
+
+
+def load_census(hospital_key):
+    # inpatient census of one hospital over every admission with an admit time, see census.py
+    def build(version):
+        paths = {name: path for name, path, _ in version}
+        times = read_partition(_version_dir(version), hospital_key, paths, columns=["admittime", "dischtime"])
+        return Census(times["admittime"], times["dischtime"])
+    return _cached_hospital("census", hospital_key, build)
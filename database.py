@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from star_schema import add_patient_labels, read_table, read_table_chunks, tables
+from summaries import all_hospitals, numeric_columns, required_columns
+
+try:
+    import duckdb
+except ImportError:  # duckdb is only needed for the duckdb database engine
+    duckdb = None
+
+# the star schema loaded into an embedded database (ETL.py --database), so the dashboard can
+# send GROUP BY / COUNT(DISTINCT) queries to it and only hold their results, not the admissions
+
+database_files = {"sqlite": "admissions.sqlite", "duckdb": "admissions.duckdb"}
+
+# surrogate keys; unique on the dimension tables, plain indexes on the fact table
+indexes = [
+    ("dim_patient", "patient_key", True),
+    ("dim_hospital", "hospital_key", True),
+    ("dim_diagnosis", "diagnosis_key", True),
+    ("fact_admissions", "patient_key", False),
+    ("fact_admissions", "hospital_key", False),
+    ("fact_admissions", "diagnosis_key", False),
+]
+
+# table alias of every column the dashboard counts by, see _admissions
+_column_tables = {
+    "admission_type": "f", "admission_location": "f", "discharge_location": "f",
+    "length_of_stay": "f", "cci_score": "f", "lace_score": "f",
+    "age": "p", "gender_label": "p", "race_category": "p", "Hospital": "h",
+}
+
+_admissions = """
+    fact_admissions f
+    LEFT JOIN dim_patient p ON p.patient_key = f.patient_key
+    LEFT JOIN dim_hospital h ON h.hospital_key = f.hospital_key
+"""
+
+# rows the per hospital numbers are worked out from, like summaries.build_summaries
+_complete = " AND ".join(f"{_column_tables[column]}.{column} IS NOT NULL" for column in required_columns)
+
+
+def require_engine(engine):
+    if engine == "duckdb" and duckdb is None:
+        raise SystemExit("--database duckdb needs duckdb, install it with `pip install duckdb`")
+
+
+def database_path(output_dir, engine):
+    return os.path.join(output_dir, database_files[engine])
+
+
+def connect(path, engine, read_only=True):
+    if engine == "duckdb":
+        return duckdb.connect(path, read_only=read_only)
+    if read_only:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    return sqlite3.connect(path)
+
+
+def _insert(con, engine, name, df, append):
+    if name == "dim_patient" and "race_category" not in df.columns:
+        df = add_patient_labels(df)
+    if engine == "duckdb":
+        con.register("frame", df)
+        con.execute(f"INSERT INTO {name} SELECT * FROM frame" if append else f"CREATE TABLE {name} AS SELECT * FROM frame")
+        con.unregister("frame")
+    else:
+        df.to_sql(name, con, index=False, if_exists="append" if append else "fail", chunksize=50_000)
+
+
+def write_database(output_dir, engine="sqlite"):
+    # (re)builds the database from the finished tables in output_dir, swapped in when complete
+    path = database_path(output_dir, engine)
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+    con = connect(tmp, engine, read_only=False)
+    for name in tables:
+        # a chunk at a time, so the fact table is never loaded whole
+        created = False
+        for df in read_table_chunks(name, output_dir):
+            _insert(con, engine, name, df, created)
+            created = True
+        if not created:
+            # no rows, the table is still created from its empty frame
+            _insert(con, engine, name, read_table(name, output_dir), False)
+    for table, column, unique in indexes:
+        con.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX idx_{table}_{column} ON {table} ({column})")
+    if engine == "sqlite":
+        con.execute("ANALYZE")
+        con.commit()
+    con.close()
+    os.replace(tmp, path)
+    return path
+
+
+class SQLSummaries:
+    # answers the same questions as the ETL's summary tables (see summaries.counts_by,
+    # hospital_metrics and hospitals) with queries against the database. results are
+    # kept, the database doesn't change under a given instance
+    def __init__(self, path, engine="sqlite"):
+        self.path = path
+        self.engine = engine
+        self._con = connect(path, engine)
+        self._lock = threading.Lock()  # one query at a time on the shared connection
+        self._results = {}
+
+    def _query(self, sql, params=()):
+        key = (sql, tuple(params))
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                if self.engine == "duckdb":
+                    result = self._con.execute(sql, list(params)).df()
+                else:
+                    result = pd.read_sql_query(sql, self._con, params=params)
+                self._results[key] = result
+        return result.copy()
+
+    def _where(self, hospital_key):
+        # every admission overall, the complete ones per hospital
+        if hospital_key == all_hospitals:
+            return "1 = 1", ()
+        return f"f.hospital_key = ? AND {_complete}", (int(hospital_key),)
+
+    def counts_by(self, column, hospital_key=all_hospitals, measure="patients"):
+        expression = f"{_column_tables[column]}.{column}"
+        aggregate = "COUNT(DISTINCT p.patient_id)" if measure == "patients" else "COUNT(*)"
+        where, params = self._where(hospital_key)
+        rows = self._query(f"""
+            SELECT {expression} AS "{column}", {aggregate} AS {measure}
+            FROM {_admissions}
+            WHERE {where} AND {expression} IS NOT NULL
+            GROUP BY {expression}
+            ORDER BY {expression}
+        """, params)
+        if column in numeric_columns:
+            rows[column] = pd.to_numeric(rows[column])
+        else:
+            rows[column] = rows[column].astype(str)
+        return rows
+
+    def hospital_metrics(self, hospital_key=all_hospitals):
+        where, params = self._where(hospital_key)
+        metrics = self._query(f"""
+            SELECT
+                COUNT(DISTINCT p.patient_id) AS total_patients,
+                COUNT(DISTINCT f.admission_id) AS total_admissions,
+                AVG(f.length_of_stay) AS avg_length_of_stay,
+                AVG(p.age) AS avg_age,
+                AVG(f.lace_score) AS avg_lace_score,
+                AVG(f.cci_score) AS avg_cci_score
+            FROM {_admissions}
+            WHERE {where}
+        """, params).iloc[0]
+        metrics["hospital_key"] = hospital_key
+        return metrics
+
+    def hospitals(self):
+        rows = self._query('SELECT "Hospital", hospital_key FROM dim_hospital WHERE "Hospital" IS NOT NULL')
+        return dict(zip(rows["Hospital"].astype(str), rows["hospital_key"]))
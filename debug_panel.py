@@ -0,0 +1,43 @@
+import pandas as pd
+import streamlit as st
+
+from chart_cache import chart_cache
+from data_loader import memory_report
+
+# the page's rerun trace (see instrumentation.py) in the sidebar. hidden unless the url has
+# ?debug=1, but each rerun's totals are kept in the session so the history is there when it's opened
+history_size = 20
+
+
+def show(trace):
+    # ends the rerun's trace (exporting it if a trace log is set), call at the end of the page
+    trace.finish()
+    summary = trace.summary()
+    history = st.session_state.setdefault("debug_reruns", [])
+    history.append(summary)
+    del history[:-history_size]
+
+    if st.query_params.get("debug") not in ("1", "true"):
+        return
+
+    with st.sidebar.expander("Rerun timings", expanded=True):
+        st.caption(f"{trace.name}: {summary['seconds'] * 1000:.0f} ms, "
+                   f"peak memory +{summary['peak_rss_delta_mb']:.1f} MB")
+        spans = pd.DataFrame(trace.records())
+        if not spans.empty:
+            spans["span"] = [" " * depth + name for depth, name in zip(spans["depth"], spans["name"])]
+            spans["ms"] = spans["seconds"] * 1000
+            st.dataframe(spans[["span", "ms", "peak_rss_delta_mb"]].rename(columns={"peak_rss_delta_mb": "peak MB"}),
+                         hide_index=True, column_config={"ms": st.column_config.NumberColumn(format="%.1f")})
+
+        st.caption("Recent reruns")
+        reruns = pd.DataFrame(history)[["time", "trace", "seconds", "peak_rss_delta_mb"]]
+        st.dataframe(reruns.rename(columns={"peak_rss_delta_mb": "peak MB"}).iloc[::-1], hide_index=True)
+
+        stats = chart_cache.stats()
+        st.caption(f"Chart cache: {stats['hits']} hits, {stats['misses']} misses, {stats['size']}/{stats['max_size']} specs")
+        if memory_report.get("shared"):
+            st.caption(f"Admissions frame: {memory_report['after'] / 2**20:.1f} MB, mapped from shared memory")
+        elif memory_report:
+            st.caption(f"Admissions frame: {memory_report['before'] / 2**20:.1f} MB loaded, "
+                       f"{memory_report['after'] / 2**20:.1f} MB kept")
@@ -0,0 +1,287 @@
+import numpy as np
+import pandas as pd
+
+from summaries import all_hospitals, all_rows, count_columns, required_columns
+
+# distinct patient counts that can be combined across hospitals and filters at query time.
+# every (hospital_key, column, value) group keeps the set of patients in it, as a sorted
+# key array when it's sparse or a bitmap over the patient_key space when it's dense (exact),
+# plus a HyperLogLog sketch (approximate, a few KB whatever the group size)
+
+distinct_file = "distinct_patients.npz"
+
+hll_precision = 12  # 4096 registers, about 1.6% standard error
+_hll_registers = 1 << hll_precision
+
+
+def _hash64(values):
+    # splitmix64 finaliser, spreads consecutive keys over the whole 64 bit range
+    x = values.astype(np.uint64)
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _leading_zeros(x):
+    count = np.zeros(len(x), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        top_clear = (x >> np.uint64(64 - shift)) == 0
+        count += top_clear.astype(np.uint8) * shift
+        x = np.where(top_clear, x << np.uint64(shift), x)
+    return count + (x == 0)
+
+
+def _sorted_unique(values):
+    # np.unique by sorting; for large int64 arrays much faster than its hash table
+    values = np.sort(values)
+    return values[np.concatenate([[True], values[1:] != values[:-1]])] if len(values) else values
+
+
+def _hll_registers_of(keys):
+    # register index and rank of every key
+    hashes = _hash64(np.asarray(keys))
+    index = (hashes >> np.uint64(64 - hll_precision)).astype(np.intp)
+    rank = np.minimum(_leading_zeros(hashes << np.uint64(hll_precision)) + 1, 64 - hll_precision + 1)
+    return index, rank.astype(np.uint8)
+
+
+def hll_sketch(keys):
+    registers = np.zeros(_hll_registers, dtype=np.uint8)
+    index, rank = _hll_registers_of(keys)
+    np.maximum.at(registers, index, rank)
+    return registers
+
+
+def hll_estimate(registers):
+    m = _hll_registers
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)  # linear counting for small sets
+    return int(round(estimate))
+
+
+class DistinctCounts:
+    def __init__(self, groups, key_space, arrays, array_offsets, bitmaps, bitmap_offsets, sketches):
+        # groups: frame of hospital_key, column, value, container (0 sparse array, 1 bitmap), slot
+        self.groups = groups
+        self.key_space = int(key_space)
+        self.arrays = arrays
+        self.array_offsets = array_offsets
+        self.bitmaps = bitmaps
+        self.bitmap_offsets = bitmap_offsets
+        self.sketches = sketches
+        self._index = {
+            (hospital, column, value): i
+            for i, (hospital, column, value)
+            in enumerate(zip(groups["hospital_key"], groups["column"], groups["value"]))
+        }
+        self._new_groups = []  # (hospital_key, column, value) of groups update() added since the last flush
+        self._pending = []  # group << 32 | patient pairs update() added since the last flush
+        self._pending_size = 0
+
+    @classmethod
+    def empty(cls):
+        groups = pd.DataFrame({
+            "hospital_key": np.zeros(0, dtype=np.int64), "column": np.zeros(0, dtype=object),
+            "value": np.zeros(0, dtype=object), "container": np.zeros(0, dtype=np.int8),
+            "slot": np.zeros(0, dtype=np.int64),
+        })
+        offsets = np.zeros(1, dtype=np.int64)
+        return cls(groups, 1, np.zeros(0, dtype=np.uint32), offsets, np.zeros(0, dtype=np.uint8), offsets,
+                   np.zeros((0, _hll_registers), dtype=np.uint8))
+
+    @classmethod
+    def build(cls, df):
+        # patients are counted by patient_id like the summaries; a patient_id that has several
+        # patient_keys (age changed between admissions) is represented by its lowest key
+        counts = cls.empty()
+        counts.update(df.assign(patient=df.groupby("patient_id")["patient_key"].transform("min")))
+        counts.flush()
+        return counts
+
+    def _group_ids(self, hospitals, column, values):
+        # index of the (hospital, column, value) groups, adding the ones not seen before
+        ids = np.empty(len(hospitals), dtype=np.int64)
+        for n, (hospital, value) in enumerate(zip(hospitals.tolist(), values)):
+            key = (hospital, column, value)
+            i = self._index.get(key)
+            if i is None:
+                i = self._index[key] = len(self._index)
+                self._new_groups.append(key)
+            ids[n] = i
+        return ids
+
+    def update(self, df):
+        # adds the patients of df's rows (hospital_key, patient, the count columns) to their groups: the
+        # same rows as the summaries, every admission overall and complete rows per hospital. sets only
+        # grow, so an incremental run passes just its new rows, a chunk at a time if need be. they're
+        # merged in (sets with OR, sketches with max) when the counts are next used or saved
+        patients = df["patient"].to_numpy(np.int64)
+        hospitals = df["hospital_key"].to_numpy(np.int64)
+        complete = df[required_columns].notna().all(axis=1).to_numpy()
+        for column in count_columns + [all_rows]:
+            if column == all_rows:
+                codes, values = np.zeros(len(df), dtype=np.intp), [all_rows]
+            else:
+                # rows are grouped on integer codes, only the distinct values are turned into text
+                codes, uniques = pd.factorize(df[column])
+                values = pd.Index(uniques).astype(str).tolist()
+            for overall in (True, False):
+                rows = codes >= 0 if overall else (codes >= 0) & complete
+                row_hospitals = np.full(np.count_nonzero(rows), all_hospitals) if overall else hospitals[rows]
+                pairs, inverse = np.unique(row_hospitals * len(values) + codes[rows], return_inverse=True)
+                groups = self._group_ids(pairs // len(values), column, [values[code] for code in pairs % len(values)])
+                members = _sorted_unique((groups[inverse] << 32) | patients[rows])
+                self._pending.append(members)
+                self._pending_size += len(members)
+        if self._pending_size > 1 << 22:
+            self.flush()
+
+    def flush(self):
+        # merges what update() added into the stored sets and sketches
+        if self._new_groups:
+            new_groups = pd.DataFrame(self._new_groups, columns=["hospital_key", "column", "value"])
+            self.groups = pd.concat([self.groups, new_groups.assign(container=-1, slot=-1)], ignore_index=True)
+            self._new_groups = []
+        if not self._pending_size:
+            self._pending = []
+            return
+        members = _sorted_unique(np.concatenate(self._pending))
+        self._pending, self._pending_size = [], 0
+        group_of = members >> 32
+        patients = members & 0xFFFFFFFF
+        key_space = max(self.key_space, int(patients.max()) + 1)
+        bitmap_bytes = (key_space + 7) // 8
+
+        sketches = np.zeros((len(self.groups), _hll_registers), dtype=np.uint8)
+        sketches[:len(self.sketches)] = self.sketches
+        index, rank = _hll_registers_of(patients)
+        np.maximum.at(sketches, (group_of, index), rank)
+
+        starts = np.searchsorted(group_of, np.arange(len(self.groups) + 1))
+        arrays, bitmaps, containers, slots = [], [], [], []
+        for i, (container, slot) in enumerate(zip(self.groups["container"].tolist(), self.groups["slot"].tolist())):
+            added = patients[starts[i]:starts[i + 1]]
+            if container == 1:
+                bits = np.zeros(bitmap_bytes, dtype=np.uint8)
+                old = self.bitmaps[self.bitmap_offsets[slot]:self.bitmap_offsets[slot + 1]]
+                bits[:len(old)] = old
+                np.bitwise_or.at(bits, added >> 3, (1 << (added & 7)).astype(np.uint8))
+            else:
+                keys = self.arrays[self.array_offsets[slot]:self.array_offsets[slot + 1]] if container == 0 else added
+                if container == 0 and len(added):
+                    keys = np.union1d(keys, added)
+                # sparse groups are cheaper as a key array than as a bitmap over every patient
+                if len(keys) * 32 < key_space:
+                    containers.append(0)
+                    slots.append(len(arrays))
+                    arrays.append(keys.astype(np.uint32))
+                    continue
+                mask = np.zeros(key_space, dtype=bool)
+                mask[keys] = True
+                bits = np.packbits(mask, bitorder="little")
+            containers.append(1)
+            slots.append(len(bitmaps))
+            bitmaps.append(bits)
+
+        def flatten(parts, dtype):
+            offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(part) for part in parts])
+            data = np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+            return data, offsets
+
+        self.groups = self.groups.assign(container=np.array(containers, dtype=np.int8), slot=np.array(slots, dtype=np.int64))
+        self.key_space = key_space
+        self.arrays, self.array_offsets = flatten(arrays, np.uint32)
+        self.bitmaps, self.bitmap_offsets = flatten(bitmaps, np.uint8)
+        self.sketches = sketches
+
+    def save(self, path):
+        self.flush()
+        np.savez_compressed(
+            path,
+            hospital_key=self.groups["hospital_key"].to_numpy(np.int64),
+            column=self.groups["column"].to_numpy(str),
+            value=self.groups["value"].to_numpy(str),
+            container=self.groups["container"].to_numpy(np.int8),
+            slot=self.groups["slot"].to_numpy(np.int64),
+            key_space=np.array(self.key_space),
+            arrays=self.arrays, array_offsets=self.array_offsets,
+            bitmaps=self.bitmaps, bitmap_offsets=self.bitmap_offsets,
+            sketches=self.sketches,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            groups = pd.DataFrame({
+                "hospital_key": data["hospital_key"], "column": data["column"].astype(object),
+                "value": data["value"].astype(object), "container": data["container"], "slot": data["slot"],
+            })
+            return cls(groups, data["key_space"], data["arrays"], data["array_offsets"],
+                       data["bitmaps"], data["bitmap_offsets"], data["sketches"])
+
+    def sizes(self):
+        # distinct patients of every group, as a frame of hospital_key, column, value and patients.
+        # column and value are all_rows for every patient of a hospital
+        self.flush()
+        containers = self.groups["container"].to_numpy()
+        slots = self.groups["slot"].to_numpy()
+        patients = np.zeros(len(self.groups), dtype=np.int64)
+        sparse = containers == 0
+        patients[sparse] = np.diff(self.array_offsets)[slots[sparse]]
+        if len(self.bitmaps):
+            bits = np.add.reduceat(np.bitwise_count(self.bitmaps).astype(np.int64), self.bitmap_offsets[:-1])
+            patients[~sparse] = bits[slots[~sparse]]
+        return self.groups[["hospital_key", "column", "value"]].assign(patients=patients)
+
+    def _groups(self, column, value, hospital_keys):
+        for hospital in hospital_keys:
+            i = self._index.get((hospital, column, str(value)))
+            if i is not None:
+                yield i
+
+    def _union(self, indexes):
+        mask = np.zeros(self.key_space, dtype=bool)
+        for i in indexes:
+            slot = self.groups.at[i, "slot"]
+            if self.groups.at[i, "container"] == 0:
+                mask[self.arrays[self.array_offsets[slot]:self.array_offsets[slot + 1]]] = True
+            else:
+                bits = self.bitmaps[self.bitmap_offsets[slot]:self.bitmap_offsets[slot + 1]]
+                mask |= np.unpackbits(bits, count=self.key_space, bitorder="little").view(bool)
+        return mask
+
+    def patients(self, hospital_keys=(all_hospitals,), filters=None, approximate=False):
+        # distinct patients seen at any of `hospital_keys` who match every `column: value` filter.
+        # filters combine per patient, e.g. {"admission_type": "URGENT", "gender_label": "Female"}
+        # counts female patients with an urgent admission; sketches can't intersect, so
+        # approximate mode only supports a single filter
+        self.flush()
+        conditions = list((filters or {}).items()) or [(all_rows, all_rows)]
+        if approximate:
+            if len(conditions) > 1:
+                raise ValueError("approximate counts only support one filter")
+            (column, value), = conditions
+            indexes = list(self._groups(column, value, hospital_keys))
+            if not indexes:
+                return 0
+            return hll_estimate(np.max(self.sketches[indexes], axis=0))
+
+        mask = None
+        for column, value in conditions:
+            selected = self._union(self._groups(column, value, hospital_keys))
+            mask = selected if mask is None else mask & selected
+        return int(np.count_nonzero(mask))
+
+    def counts_by(self, column, hospital_keys=(all_hospitals,), approximate=False):
+        # distinct patients per value of `column` across several hospitals, like summaries.counts_by
+        self.flush()
+        values = np.sort(self.groups.loc[
+            (self.groups["column"] == column) & self.groups["hospital_key"].isin(list(hospital_keys)), "value"
+        ].unique())
+        counts = [self.patients(hospital_keys, {column: value}, approximate) for value in values]
+        return pd.DataFrame({column: values, "patients": counts})
@@ -0,0 +1,55 @@
+import os
+import time
+import traceback
+
+from ETL import build_parser, load_state, publish, source_files
+from star_schema import current_dir
+
+# keeps the dashboard data up to date: polls the source and publishes a new ETL version
+# (see ETL.py --publish) whenever it changed. a running dashboard picks the new version
+# up on its next rerun, so nobody has to run the ETL or restart Streamlit by hand
+
+
+def source_stamp(source):
+    stamps = []
+    for path in source_files(source):
+        stat = os.stat(path)
+        stamps.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(stamps)
+
+
+def is_published(args, stamp):
+    # the live version records the size and modification time of each source file it was built from,
+    # so a file rewritten with the same size still counts as changed
+    live = current_dir(args.output_dir)
+    if live == args.output_dir:
+        return False
+    state = load_state(live)
+    return (state["sources"] == {path: size for path, size, _ in stamp}
+            and state.get("modified") == {path: modified for path, _, modified in stamp})
+
+
+def main():
+    parser = build_parser()
+    parser.description = "Run the ETL in the background whenever the source changes."
+    parser.add_argument("--interval", type=float, default=30, help="seconds between checks of the source")
+    args = parser.parse_args()
+    args.publish = True
+
+    previous = None
+    while True:
+        try:
+            stamp = source_stamp(args.source)
+            # wait until the source stopped changing for one interval, it may still be being written
+            if stamp == previous and not is_published(args, stamp):
+                publish(args)
+            previous = stamp
+        except Exception:
+            # a bad extract shouldn't stop the watcher, the dashboard keeps showing the last good version
+            traceback.print_exc()
+            previous = None
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
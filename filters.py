@@ -0,0 +1,42 @@
+from functools import reduce
+
+import numpy as np
+
+# columns of the Patients table; admissions with a gap in any of them are never listed
+table_columns = {
+    "patient_id": "Patient ID", "age": "Age", "gender": "Gender", "length_of_stay": "Length of Stay",
+    "diagnosis_description": "Diagnosis", "cci_score": "CCI Score", "lace_score": "LACE Score",
+}
+
+# columns with an "above average" filter on the Patients page
+above_average_columns = ["lace_score", "cci_score", "length_of_stay"]
+
+
+class FilterMasks:
+    # one packed bitmask per filter over all admissions, built once per data version.
+    # a rerun only ANDs the active masks together (1 bit per admission each) and
+    # turns the result into row positions, no filtered copies of the frame are made
+    def __init__(self, df):
+        self.size = len(df)
+        self.thresholds = {column: df[column].mean() for column in above_average_columns}
+
+        predicates = {"complete": df[list(table_columns)].notna().all(axis=1)}
+        for column, threshold in self.thresholds.items():
+            predicates[f"high_{column}"] = df[column] > threshold
+        self.masks = {name: self._pack(mask.to_numpy()) for name, mask in predicates.items()}
+
+    def _pack(self, mask):
+        return np.packbits(mask.astype(bool), bitorder="little")
+
+    def select(self, active, rows=None):
+        # positions of the admissions passing every `active` filter, limited to `rows` if given
+        combined = reduce(np.bitwise_and, [self.masks[name] for name in active]) if active else None
+        if rows is not None:
+            rows = np.asarray(rows)
+            if combined is None:
+                return rows
+            # just test the bits of the given rows instead of unpacking the whole mask
+            return rows[(combined[rows >> 3] >> (rows & 7).astype(np.uint8)) & 1 == 1]
+        if combined is None:
+            return np.arange(self.size)
+        return np.flatnonzero(np.unpackbits(combined, count=self.size, bitorder="little"))
@@ -0,0 +1,60 @@
+import json
+import math
+import os
+
+from readmissions import readmission_counts
+from summaries import all_hospitals, hospital_metrics, hospitals
+
+# the metrics at the top of the Home and Hospitals pages and the hospital names, overall and per
+# hospital, in one small json file written by the ETL. the pages read it first, so the numbers are
+# on screen before the summaries, readmissions or altair are loaded for the charts underneath
+
+headline_file = "headline.json"
+
+metric_columns = [
+    "total_patients", "total_admissions", "avg_length_of_stay", "avg_age", "avg_lace_score", "avg_cci_score",
+]
+
+
+def _number(value):
+    # json has no NaN; a hospital without complete admissions has no averages
+    value = float(value)
+    if math.isnan(value):
+        return None
+    return int(value) if value.is_integer() and abs(value) < 2**53 else value
+
+
+def build_headline(summaries, rates):
+    # summaries: the summary tables (or a query backend), rates: the readmission rate table
+    names = {name: int(key) for name, key in sorted(hospitals(summaries).items())}
+    metrics = {}
+    for hospital_key in [all_hospitals] + list(names.values()):
+        row = hospital_metrics(summaries, hospital_key)
+        readmitted, admitted = readmission_counts(rates, hospital_key)
+        metrics[hospital_key] = {
+            **{column: _number(row[column]) for column in metric_columns},
+            "readmissions": readmitted,
+            "readmission_admissions": admitted,
+        }
+    return {"hospitals": names, "metrics": metrics}
+
+
+def save_headline(headline, path):
+    with open(path + ".tmp", "w") as f:
+        json.dump(headline, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def load_headline(path):
+    with open(path) as f:
+        headline = json.load(f)
+    headline["metrics"] = {int(key): values for key, values in headline["metrics"].items()}
+    return headline
+
+
+def headline_metrics(headline, hospital_key=all_hospitals):
+    # the hospital's metrics, with the readmission rate worked out (None without admissions)
+    values = dict(headline["metrics"][hospital_key])
+    admitted = values["readmission_admissions"]
+    values["readmission_rate"] = values["readmissions"] / admitted if admitted else None
+    return values
@@ -0,0 +1,219 @@
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # windows; memory is then only measured where /proc exists
+    resource = None
+
+# where the time and memory go in an ETL run or a page rerun. a Trace is one run, made of
+# spans (nested `with span(...)` blocks, or a script's top level phases); each span records
+# its wall time and how far resident memory rose above where it started. one background
+# thread samples memory for every open trace, so spans themselves cost a few microseconds
+
+# finished traces are appended here as JSON lines when set (ETL.py --trace-log, or the
+# DASHBOARD_TRACE_LOG environment variable for the dashboard)
+log_file = os.environ.get("DASHBOARD_TRACE_LOG")
+
+sample_interval = 0.005  # seconds between memory samples while a trace is open
+
+_local = threading.local()  # .trace of the run on this thread, .depth of the open spans
+_active = weakref.WeakSet()  # traces being sampled; an abandoned one drops out once it's collected
+_active_lock = threading.Lock()
+_wake = threading.Event()
+_sampler = None
+
+
+def rss():
+    # resident memory of this process in bytes
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0
+        # elsewhere only the high water mark is available, so spans only show growth past it
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _sample():
+    while True:
+        with _active_lock:
+            traces = list(_active)
+        if not traces:
+            _wake.wait()
+            _wake.clear()
+            continue
+        value = rss()
+        for trace in traces:
+            trace._update(value)
+        del traces
+        time.sleep(sample_interval)
+
+
+def _start_sampler():
+    global _sampler
+    with _active_lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample, name="rss-sampler", daemon=True)
+            _sampler.start()
+    _wake.set()
+
+
+class Span:
+    __slots__ = ("name", "depth", "start", "seconds", "rss", "peak")
+
+    def __init__(self, name, depth, start, rss):
+        self.name = name
+        self.depth = depth
+        self.start = start
+        self.seconds = None
+        self.rss = rss
+        self.peak = rss
+
+    def record(self):
+        return {"name": self.name, "depth": self.depth, "start": round(self.start, 6),
+                "seconds": round(self.seconds, 6) if self.seconds is not None else None,
+                "rss_mb": round(self.rss / 2**20, 1), "peak_rss_delta_mb": round((self.peak - self.rss) / 2**20, 1)}
+
+
+class Trace:
+    # one run: spans in the order they started, the run's wall time and its peak memory
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.seconds = None
+        self.closed = False
+        self.spans = []
+        self.rss = self.peak = rss()
+        self._clock = time.perf_counter()
+        self._open = []
+        self._phase = None
+        self._lock = threading.Lock()
+        with _active_lock:
+            _active.add(self)
+        _start_sampler()
+
+    def _update(self, value):
+        with self._lock:
+            self.peak = max(self.peak, value)
+            for span in self._open:
+                span.peak = max(span.peak, value)
+
+    def open(self, name, depth=0):
+        value = rss()
+        span = Span(name, depth, time.perf_counter() - self._clock, value)
+        with self._lock:
+            self.peak = max(self.peak, value)
+            self.spans.append(span)
+            self._open.append(span)
+        return span
+
+    def close(self, span):
+        self._update(rss())
+        span.seconds = time.perf_counter() - self._clock - span.start
+        with self._lock:
+            if span in self._open:
+                self._open.remove(span)
+
+    def phase(self, name):
+        # ends the script's current top level phase, if any, and starts the next one
+        if self._phase is not None:
+            self.close(self._phase)
+        self._phase = self.open(name) if not self.closed else None
+
+    def finish(self):
+        # closes whatever is still open, stops sampling and exports the trace; safe to call twice
+        if self.closed:
+            return self
+        if self._phase is not None:
+            self.close(self._phase)
+            self._phase = None
+        for span in list(self._open):
+            self.close(span)
+        self.seconds = time.perf_counter() - self._clock
+        self.closed = True
+        with _active_lock:
+            _active.discard(self)
+        if getattr(_local, "trace", None) is self:
+            _local.trace = None
+        if log_file:
+            export(self, log_file)
+        return self
+
+    def records(self):
+        with self._lock:
+            return [span.record() for span in self.spans]
+
+    def summary(self):
+        return {"trace": self.name, "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "pid": os.getpid(), "seconds": round(self.seconds, 6) if self.seconds is not None else None,
+                "rss_mb": round(self.rss / 2**20, 1), "peak_rss_delta_mb": round((self.peak - self.rss) / 2**20, 1)}
+
+
+def start_trace(name):
+    # a new trace for the run on this thread; spans opened on it (or in threads it's attached to) go in it
+    previous = getattr(_local, "trace", None)
+    if previous is not None:
+        previous.finish()
+    _local.trace = Trace(name)
+    _local.depth = 0
+    return _local.trace
+
+
+def current():
+    return getattr(_local, "trace", None)
+
+
+def attach(trace):
+    # spans opened on this thread go into `trace`, e.g. a loader thread working for a page rerun
+    _local.trace = trace
+    _local.depth = 0
+
+
+def phase(name):
+    # the next top level phase of the run on this thread, see Trace.phase
+    trace = getattr(_local, "trace", None)
+    if trace is not None and not trace.closed:
+        trace.phase(name)
+
+
+@contextmanager
+def span(name):
+    trace = getattr(_local, "trace", None)
+    if trace is None or trace.closed:
+        yield None
+        return
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    opened = trace.open(name, depth + (trace._phase is not None))
+    try:
+        yield opened
+    finally:
+        _local.depth = depth
+        trace.close(opened)
+
+
+def export(trace, path):
+    # one JSON line per trace: its summary with the spans in start order
+    line = json.dumps({**trace.summary(), "spans": trace.records()})
+    with open(path, "a") as f:
+        f.write(line + "\n")
+
+
+def format_trace(trace):
+    # plain text table of a trace's spans, nested ones indented
+    lines = [f"{'span':<44}{'seconds':>10}{'peak mb':>10}"]
+    for record in trace.records():
+        name = "  " * record["depth"] + record["name"]
+        seconds = record["seconds"] if record["seconds"] is not None else float("nan")
+        lines.append(f"{name:<44}{seconds:>10.3f}{record['peak_rss_delta_mb']:>10.1f}")
+    summary = trace.summary()
+    lines.append(f"{'total':<44}{summary['seconds'] or 0:>10.3f}{summary['peak_rss_delta_mb']:>10.1f}")
+    return "\n".join(lines)
@@ -1,150 +1,40 @@
+import datetime
+from functools import partial
+
+import numpy as np
 import streamlit as st
-<<<<<<< HEAD
 import pandas as pd
-import altair as alt
+
+import debug_panel
+from binning import histogram
+from chart_cache import chart_spec, chart_specs
+from data_loader import (
+    load_census, load_distinct_counts, load_headline, load_hospital, load_readmissions, load_summaries
+)
+from filters import table_columns
+from headline import headline_metrics
+from instrumentation import start_trace
+from pagination import page_count, page_positions
+from readmissions import lace_bands, rates_by
+from summaries import all_hospitals, counts_by
 
 st.set_page_config(page_title="Patient Dashboard", layout="wide")
 
-def load_data():
-    import pandas as pd
-    import os
-
-    output_dir = "etl_output"  # folder where your ETL CSVs are saved
-
-    # Load dimension tables
-    dim_patient = pd.read_csv(os.path.join(output_dir, "dim_patient.csv"))
-    dim_hospital = pd.read_csv(os.path.join(output_dir, "dim_hospital.csv"))
-    dim_diagnosis = pd.read_csv(os.path.join(output_dir, "dim_diagnosis.csv"))
-
-    # Load fact table
-    fact_admissions = pd.read_csv(os.path.join(output_dir, "fact_admissions.csv"))
-
-    # Merge dimensions to fact table to reconstruct original columns needed for dashboard
-    df = fact_admissions.merge(dim_patient, on="patient_key", how="left") \
-                        .merge(dim_hospital, on="hospital_key", how="left") \
-                        .merge(dim_diagnosis, on="diagnosis_key", how="left")
-
-    # Add race_category and gender_label as before
-    race_grouped = {
-        'White': [
-            'WHITE', 
-            'WHITE - OTHER EUROPEAN', 
-            'WHITE - RUSSIAN', 
-            'WHITE - BRAZILIAN', 
-            'WHITE - EASTERN EUROPEAN'
-        ],
-        'Black': [
-            'BLACK/AFRICAN AMERICAN', 
-            'BLACK/CARIBBEAN ISLAND', 
-            'BLACK/AFRICAN', 
-            'BLACK/CAPE VERDEAN'
-        ],
-        'Hispanic': [
-            'HISPANIC/LATINO - PUERTO RICAN', 
-            'HISPANIC/LATINO - HONDURAN', 
-            'HISPANIC/LATINO - DOMINICAN', 
-            'HISPANIC/LATINO - MEXICAN', 
-            'HISPANIC/LATINO - SALVADORAN', 
-            'HISPANIC/LATINO - GUATEMALAN', 
-            'HISPANIC/LATINO - COLUMBIAN', 
-            'HISPANIC/LATINO - CUBAN', 
-            'HISPANIC/LATINO - CENTRAL AMERICAN', 
-            'HISPANIC OR LATINO'
-        ],
-        'Asian': [
-            'ASIAN - SOUTH EAST ASIAN', 
-            'ASIAN', 
-            'ASIAN - CHINESE', 
-            'ASIAN - KOREAN', 
-            'ASIAN - ASIAN INDIAN'
-        ],
-        'Other': [
-            'OTHER', 
-            'UNKNOWN', 
-            'UNABLE TO OBTAIN', 
-            'PATIENT DECLINED TO ANSWER', 
-            'SOUTH AMERICAN', 
-            'PORTUGUESE',
-            'NATIVE HAWAIIAN OR OTHER PACIFIC ISLANDER',
-            'AMERICAN INDIAN/ALASKA NATIVE'
-        ]
-    }
-
-    def group_races(race_value):
-        for category, races in race_grouped.items():
-            if race_value in races:
-                return category
-        return 'Other/Unknown'
-
-    df['race_category'] = df['race'].apply(group_races)
-    df['gender_label'] = df['gender'].map({'M': 'Male', 'F': 'Female'})
-
-    return df
-
-df_all = load_data()
-
-hospital_list = df_all["Hospital"].dropna().unique()
-selected_hospital = st.selectbox("Select a Hospital", sorted(hospital_list))
-df = df_all[df_all["Hospital"] == selected_hospital]
-
-df = df.dropna(subset=['length_of_stay', 'age', 'lace_score', 'cci_score'])
-
-race_grouped = {
-    'White': [
-        'WHITE', 
-        'WHITE - OTHER EUROPEAN', 
-        'WHITE - RUSSIAN', 
-        'WHITE - BRAZILIAN', 
-        'WHITE - EASTERN EUROPEAN'
-    ],
-    'Black': [
-        'BLACK/AFRICAN AMERICAN', 
-        'BLACK/CARIBBEAN ISLAND', 
-        'BLACK/AFRICAN', 
-        'BLACK/CAPE VERDEAN'
-    ],
-    'Hispanic': [
-        'HISPANIC/LATINO - PUERTO RICAN', 
-        'HISPANIC/LATINO - HONDURAN', 
-        'HISPANIC/LATINO - DOMINICAN', 
-        'HISPANIC/LATINO - MEXICAN', 
-        'HISPANIC/LATINO - SALVADORAN', 
-        'HISPANIC/LATINO - GUATEMALAN', 
-        'HISPANIC/LATINO - COLUMBIAN', 
-        'HISPANIC/LATINO - CUBAN', 
-        'HISPANIC/LATINO - CENTRAL AMERICAN', 
-        'HISPANIC OR LATINO'
-    ],
-    'Asian': [
-        'ASIAN - SOUTH EAST ASIAN', 
-        'ASIAN', 
-        'ASIAN - CHINESE', 
-        'ASIAN - KOREAN', 
-        'ASIAN - ASIAN INDIAN'
-    ],
-    'Other': [
-        'OTHER', 
-        'UNKNOWN', 
-        'UNABLE TO OBTAIN', 
-        'PATIENT DECLINED TO ANSWER', 
-        'SOUTH AMERICAN', 
-        'PORTUGUESE',
-        'NATIVE HAWAIIAN OR OTHER PACIFIC ISLANDER',
-        'AMERICAN INDIAN/ALASKA NATIVE'
-    ]
-}
-
-def group_races(race_value):
-    for category, races in race_grouped.items():
-        if race_value in races:
-            return category
-    return 'Other/Unknown'
-df['race_category'] = df['race'].apply(group_races)
-
-def create_bar(group_column, title, bar_size=20, data=None):
-    if data is None:
-        data = df
-    group_counts = df.groupby(group_column)["patient_id"].nunique().reset_index()
+# timings of this rerun, in the sidebar with ?debug=1 (see debug_panel.py)
+trace = start_trace("Hospitals")
+trace.phase("load")
+
+# the hospital names and metrics come from the ETL's small headline file, so they're on screen before
+# anything the charts need is loaded. like the charts' summaries, the per hospital numbers only
+# count admissions with length of stay, age, LACE and CCI scores recorded
+headline = load_headline()
+
+hospital_keys = headline["hospitals"]
+selected_hospital = st.selectbox("Select a Hospital", sorted(hospital_keys))
+hospital_key = hospital_keys[selected_hospital]
+
+def create_bar(hospital_key, group_column, title, bar_size=20):
+    group_counts = counts_by(summary, group_column, hospital_key)
     group_counts.columns = [group_column, "Patient Count"]
     group_counts = group_counts.sort_values(by=group_column, ascending=True)
 
@@ -172,10 +62,8 @@ def create_bar(group_column, title, bar_size=20, data=None):
     )
     return chart
 
-df['gender_label'] = df['gender'].map({'M': 'Male', 'F': 'Female'})
-
-def gender_pie(df, title):
-    gender_counts = df['gender_label'].value_counts().reset_index()
+def gender_pie(hospital_key, title):
+    gender_counts = counts_by(summary, 'gender_label', hospital_key, measure="admissions")
     gender_counts.columns = ['Gender', 'Count']
     chart = alt.Chart(gender_counts).mark_arc(innerRadius=50).encode(
         theta=alt.Theta(field="Count", type="quantitative"),
@@ -193,8 +81,8 @@ def gender_pie(df, title):
     )
     return chart
 
-def create_pie(group_column, title):
-    group_counts = df[group_column].value_counts().reset_index()
+def create_pie(hospital_key, group_column, title):
+    group_counts = counts_by(summary, group_column, hospital_key, measure="admissions")
     group_counts.columns = [group_column, "Count"]
 
     chart = alt.Chart(group_counts).mark_arc(innerRadius=50).encode(
@@ -212,7 +100,7 @@ def create_pie(group_column, title):
     return chart
 
 def bar_hospitals(column_name, title):
-    counts = df_all[column_name].value_counts().reset_index()
+    counts = counts_by(summary, column_name, all_hospitals, measure="admissions")
     counts.columns = [column_name, "Count"]
 
     chart = alt.Chart(counts).mark_bar(size=20, color="#56B4E9").encode(
@@ -228,128 +116,252 @@ def bar_hospitals(column_name, title):
     )
     return chart
 
-# checking if df_all displayed hospitals correctly 
-# st.write(df_all["Hospital"].value_counts())
-
-
-age_histogram = alt.Chart(df).mark_bar(color="#56B4E9").encode(
-    alt.X("age:Q", bin=alt.Bin(maxbins=20), title="Age"),
-    alt.Y("count():Q", title="Number of Patients"),
-    tooltip=["age:Q", "count():Q"]
-).properties(
-    height=400,
-    width=400,
-    title="Age Distribution of Patients"
-).configure_view(
-    stroke=None
-).configure_axis(
-    grid=False,
-    labelFontSize=16,
-    titleFontSize=18,
-    labelColor="#555",
-    titleColor="#222"
-).configure_title(
-    fontSize=20,
-    anchor='start',
-    font='Helvetica',
-    color='#333'
-)
+# age histogram binned here from the admissions per age, so the chart only carries the bars
+def age_histogram(hospital_key):
+    age_counts = counts_by(summary, "age", hospital_key, measure="admissions")
+    age_bins = histogram(age_counts["age"], age_counts["admissions"], bins=20)
+    age_bins.columns = ["bin_start", "bin_end", "Count"]
+    chart = alt.Chart(age_bins).mark_bar(color="#56B4E9").encode(
+        alt.X("bin_start:Q", bin="binned", title="Age"),
+        alt.X2("bin_end:Q"),
+        alt.Y("Count:Q", title="Number of Patients"),
+        tooltip=[alt.Tooltip("bin_start:Q", title="Age from"), alt.Tooltip("bin_end:Q", title="Age to"), "Count:Q"]
+    ).properties(
+        height=400,
+        width=400,
+        title="Age Distribution of Patients"
+    ).configure_view(
+        stroke=None
+    ).configure_axis(
+        grid=False,
+        labelFontSize=16,
+        titleFontSize=18,
+        labelColor="#555",
+        titleColor="#222"
+    ).configure_title(
+        fontSize=20,
+        anchor='start',
+        font='Helvetica',
+        color='#333'
+    )
+    return chart
+
+# readmission rate per LACE band, the bands in risk order
+def readmission_bar(hospital_key):
+    rates = rates_by(readmits, "lace_band", hospital_key)
+    chart = alt.Chart(rates).mark_bar(size=48, color="#56B4E9").encode(
+        x=alt.X("lace_band:N", title="LACE Band", sort=list(lace_bands), axis=alt.Axis(labelAngle=0)),
+        y=alt.Y("rate:Q", title="Readmitted within 30 days", axis=alt.Axis(format="%")),
+        tooltip=[alt.Tooltip("lace_band:N", title="LACE Band"), "admissions:Q", "readmissions:Q",
+                 alt.Tooltip("rate:Q", title="Rate", format=".1%")]
+    ).properties(
+        height=425,
+        width=350,
+        title="30-Day Readmissions by LACE Band"
+    ).configure_view(
+        stroke=None
+    ).configure_axis(
+        grid=False,
+        labelFontSize=12,
+        titleFontSize=14,
+        labelColor="#555",
+        titleColor="#222"
+    ).configure_title(
+        fontSize=18,
+        anchor='start',
+        font='Helvetica',
+        color='#333'
+    )
+    return chart
+
+# flip axes, allow for longer labels so they dont get cut off, sort by x to show distribution better
+def horizontal_bar(hospital_key, group_column, title, bar_size=20):
+    return create_bar(hospital_key, group_column, title, bar_size).encode(
+        x=alt.X("Patient Count:Q", title="Patients"),
+        y=alt.Y(f'{group_column}:N', title=title, sort='-x', axis=alt.Axis(labelLimit=200)))
+
+# most points in the occupancy chart; longer daily ranges are grouped into buckets of several days
+max_census_points = 2000
+
+def census_chart(hospital_key, start, end, hourly):
+    if hourly:
+        data = census.hourly(start, end).rename(columns={"time": "date", "census": "Patients"})
+        data = data.melt("date", var_name="Measure", value_name="Count")
+    else:
+        daily = census.daily(start, end)
+        bucket = -(-len(daily) // max_census_points)
+        if bucket > 1:
+            # average midnight census and highest peak of each bucket of days
+            starts = np.arange(0, len(daily), bucket)
+            daily = pd.DataFrame({
+                "date": daily["date"].to_numpy()[starts],
+                "census": np.add.reduceat(daily["census"].to_numpy(), starts) / np.diff(np.append(starts, len(daily))),
+                "peak": np.maximum.reduceat(daily["peak"].to_numpy(), starts),
+            })
+        data = daily.rename(columns={"census": "Midnight census", "peak": "Peak"})
+        data = data.melt("date", var_name="Measure", value_name="Count")
+
+    chart = alt.Chart(data).mark_line(interpolate="step-after").encode(
+        x=alt.X("date:T", title="Date"),
+        y=alt.Y("Count:Q", title="Patients in hospital"),
+        color=alt.Color("Measure:N", legend=alt.Legend(title=None, orient="top")),
+        tooltip=[alt.Tooltip("date:T", title="Date", format="%Y-%m-%d %H:%M" if hourly else "%Y-%m-%d"),
+                 "Measure:N", alt.Tooltip("Count:Q", format=".1f")]
+    ).properties(
+        height=300,
+        title="Inpatient Census"
+    ).configure_title(
+        fontSize=18,
+        anchor='start',
+        font='Helvetica',
+        color='#333'
+    )
+    return chart
+
+# two charts a row. the specs are worked out together on the shared chart pool (see chart_cache.py)
+# and each one is drawn in its place as soon as it's ready
+def show_charts(charts):
+    columns = st.columns(2)
+    slots = [columns[i % 2].empty() for i in range(len(charts))]
+    for i, spec in chart_specs(charts):
+        slots[i].vega_lite_chart(spec, use_container_width=True)
 
 # title
+trace.phase("metrics")
 st.title("Patient Overview Dashboard")
 # metrics
+metrics = headline_metrics(headline, hospital_key)
 col1, col2, col3 = st.columns(3)
 with col1:
-    st.metric("Total Patients", df["patient_id"].nunique())
+    st.metric("Total Patients", metrics["total_patients"])
 with col2:
-    st.metric("Total Admissions", df["admission_id"].nunique())
+    st.metric("Total Admissions", metrics["total_admissions"])
 with col3:
-    st.metric("Average Length of Stay", f"{df['length_of_stay'].mean():.2f} days")
+    st.metric("Average Length of Stay", f"{metrics['avg_length_of_stay']:.2f} days")
 
 col4, col5, col6 = st.columns(3)
 with col4:
-    st.metric("Average Age", f"{df['age'].mean():.1f} years")
+    st.metric("Average Age", f"{metrics['avg_age']:.1f} years")
 with col5:
-    st.metric("Average LACE Score", f"{df['lace_score'].mean():.2f}")
+    st.metric("Average LACE Score", f"{metrics['avg_lace_score']:.2f}")
 with col6:
-    st.metric("Average CCI Score", f"{df['cci_score'].mean():.2f}")
-
-# creating charts
-gender_chart = gender_pie(df, 'Gender')
-
-race_pie_chart = create_pie('race_category', 'Race')
-
-admission_type_chart = create_bar('admission_type', 'Admission Type', bar_size=30)
-
-admission_location_chart = create_bar('admission_location', 'Admission Location', bar_size=25)
-
-discharge_location_chart = create_bar('discharge_location', 'Discharge Location')
-
-length_of_stay_chart = create_bar('length_of_stay', 'Length of Stay', bar_size=10)
-
-cci_score_chart = create_bar('cci_score', 'CCI Score', bar_size=48)
-
-lace_score_chart = create_bar('lace_score', 'LACE Score', bar_size=35)
-
-hospital_chart = bar_hospitals('Hospital', 'Hospital')
-
-# flip axes, allow for longer labels so they dont get cut off, sort by x to show distribution better
-admission_type_chart = admission_type_chart.encode(
-    x=alt.X("Patient Count:Q", title="Patients"),
-    y=alt.Y('admission_type:N', title='Admission Type',sort='-x',axis=alt.Axis(labelLimit=200)))
-admission_location_chart = admission_location_chart.encode(
-    x=alt.X("Patient Count:Q", title="Patients"),
-    y=alt.Y('admission_location:N', title='Admission Location',sort='-x',axis=alt.Axis(labelLimit=200)))
-discharge_location_chart = discharge_location_chart.encode(
-    x=alt.X("Patient Count:Q", title="Patients"),
-    y=alt.Y('discharge_location:N', title='Discharge Location',sort='-x',axis=alt.Axis(labelLimit=200)))
-
-# separate columns
-
-col1, col2 = st.columns(2)
-with col1:
-    st.markdown("### Admissions and Locations")
-    st.altair_chart(admission_type_chart, use_container_width=True)
-    st.altair_chart(admission_location_chart, use_container_width=True)
-    st.altair_chart(discharge_location_chart, use_container_width=True)
-    st.altair_chart(hospital_chart, use_container_width=True)
-
-with col2:
-    st.markdown("### Demographics")
-    st.altair_chart(age_histogram, use_container_width=True)
-    st.altair_chart(gender_chart, use_container_width=True)
-    st.altair_chart(race_pie_chart, use_container_width=True)
-
-    st.markdown("### Additional Details")
-    st.altair_chart(length_of_stay_chart, use_container_width=True)
-    st.altair_chart(cci_score_chart, use_container_width=True)
-    st.altair_chart(lace_score_chart, use_container_width=True)
-=======
+    st.metric("Average CCI Score", f"{metrics['avg_cci_score']:.2f}")
+
+# readmissions to any hospital within 30 days of a discharge from this one, over all its admissions
+readmission_share = metrics["readmission_rate"]
+overall_share = headline_metrics(headline)["readmission_rate"]
+col11, col12, _ = st.columns(3)
+with col11:
+    st.metric(
+        "30-Day Readmission Rate",
+        f"{readmission_share:.1%}" if readmission_share is not None else "n/a",
+        delta=f"{readmission_share - overall_share:+.1%} vs all hospitals"
+        if readmission_share is not None and overall_share is not None else None,
+        delta_color="inverse"
+    )
+with col12:
+    st.metric("30-Day Readmissions", metrics["readmissions"], help=f"of {metrics['readmission_admissions']} admissions")
+
+# the expanders and tabs below only run while they're open (opening one reruns the page), so the
+# patient sets, the hospital's admissions and the charts are only loaded once they're looked at
+
+# unique patients across several hospitals can't be added up from the per hospital totals,
+# so they're counted by combining the hospitals' patient sets
+combine_expander = st.expander("Combine with other hospitals", key="combine_hospitals", on_change="rerun")
+if combine_expander.open:
+    with combine_expander:
+        combined = st.multiselect("Other hospitals", sorted(set(hospital_keys) - {selected_hospital}))
+        combined_keys = [hospital_key] + [hospital_keys[name] for name in combined]
+        distinct_counts = load_distinct_counts()
+        col7, col8 = st.columns(2)
+        with col7:
+            st.metric("Unique Patients", distinct_counts.patients(combined_keys))
+        with col8:
+            st.metric("Unique Patients (estimate)", distinct_counts.patients(combined_keys, approximate=True))
+
+trace.phase("admissions")
+
+# the selected hospital's own admissions, read from its partition and kept for the next few switches
+admissions_expander = st.expander("Admissions", key="hospital_admissions", on_change="rerun")
+if admissions_expander.open:
+    with admissions_expander:
+        hospital_df = load_hospital(hospital_key)
+        pages = page_count(len(hospital_df), 50)
+        if st.session_state.get("hospital_page", 1) > pages:
+            st.session_state["hospital_page"] = pages
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key="hospital_page")
+        positions = page_positions(hospital_df, range(len(hospital_df)), page=page, page_size=50)
+        st.dataframe(hospital_df.iloc[positions][list(table_columns)].rename(columns=table_columns))
+
+trace.phase("charts")
+
+# altair is imported here rather than at the top so a cold start shows the metrics without waiting for it
 import altair as alt
-import pandas as pd
-
-st.set_page_config(page_title="Hospitals", layout="wide")
-
-st.title("🏥 Hospitals Overview")
-
-df = pd.read_csv("data.csv")
-
-# Example: Number of patients by Hospital
-hospital_chart = df.groupby("Hospital")["patient_id"].nunique().reset_index()
-hospital_chart.columns = ["Hospital", "Patient Count"]
 
-chart = alt.Chart(hospital_chart).mark_bar(size=15, color="#F58518").encode(
-    x=alt.X("Hospital:N", title="Hospital"),
-    y=alt.Y("Patient Count:Q", title="Patients"),
-    tooltip=["Hospital:N", "Patient Count:Q"]
-).properties(
-    height=300,
-    title="👥 Patients by Hospital"
-).configure_view(
-    stroke=None
-).configure_axis(
-    grid=False
+occupancy_tab, locations_tab, demographics_tab, details_tab = st.tabs(
+    ["Bed Occupancy", "Admissions and Locations", "Demographics", "Additional Details"],
+    key="hospital_charts", on_change="rerun"
 )
 
-st.altair_chart(chart, use_container_width=True)
->>>>>>> 88ddf07edf562a45d4aa0016551a44b907822a0d
+# bed occupancy from the admit and discharge times of every admission at the hospital, see census.py
+if occupancy_tab.open:
+    with occupancy_tab:
+        census = load_census(hospital_key)
+        span = census.span()
+        if span is None:
+            st.write("No admissions with admit times.")
+        else:
+            daily_census = census.daily()
+            peak, peak_time = census.peak()
+            col9, col10 = st.columns(2)
+            with col9:
+                st.metric("Average Midnight Census", f"{daily_census['census'].mean():.1f} patients")
+            with col10:
+                st.metric("Peak Census", f"{peak} patients", help=f"first reached {peak_time:%Y-%m-%d %H:%M}")
+
+            first, last = (pd.Timestamp(day).date() for day in span)
+            start, end = st.slider("Occupancy dates", min_value=first, max_value=last,
+                                   value=(max(first, last - datetime.timedelta(days=90)), last), format="YYYY-MM-DD")
+            hourly = st.toggle("Hourly census")
+            if hourly and (end - start).days > 60:
+                st.caption("Hourly census is shown for ranges of up to 60 days, showing the last 60")
+                start = end - datetime.timedelta(days=60)
+            st.vega_lite_chart(chart_spec(census_chart, hospital_key, start, end, hourly, data=census),
+                               use_container_width=True)
+
+# the other charts are drawn from the ETL's per hospital summaries, built once per hospital and dataset
+# and served from the spec cache on later reruns (see chart_cache.py)
+if locations_tab.open:
+    with locations_tab:
+        summary = load_summaries()
+        show_charts([
+            partial(chart_spec, horizontal_bar, hospital_key, 'admission_type', 'Admission Type', bar_size=30,
+                    data=summary),
+            partial(chart_spec, horizontal_bar, hospital_key, 'admission_location', 'Admission Location', bar_size=25,
+                    data=summary),
+            partial(chart_spec, horizontal_bar, hospital_key, 'discharge_location', 'Discharge Location',
+                    data=summary),
+            partial(chart_spec, bar_hospitals, 'Hospital', 'Hospital', data=summary),
+        ])
+
+if demographics_tab.open:
+    with demographics_tab:
+        summary = load_summaries()
+        show_charts([
+            partial(chart_spec, age_histogram, hospital_key, data=summary),
+            partial(chart_spec, gender_pie, hospital_key, 'Gender', data=summary),
+            partial(chart_spec, create_pie, hospital_key, 'race_category', 'Race', data=summary),
+        ])
+
+if details_tab.open:
+    with details_tab:
+        summary = load_summaries()
+        readmits = load_readmissions()
+        show_charts([
+            partial(chart_spec, create_bar, hospital_key, 'length_of_stay', 'Length of Stay', bar_size=10, data=summary),
+            partial(chart_spec, create_bar, hospital_key, 'cci_score', 'CCI Score', bar_size=48, data=summary),
+            partial(chart_spec, create_bar, hospital_key, 'lace_score', 'LACE Score', bar_size=35, data=summary),
+            partial(chart_spec, readmission_bar, hospital_key, data=readmits),
+        ])
+
+debug_panel.show(trace)
@@ -1,41 +1,18 @@
 import streamlit as st
-import pandas as pd
-import os
-
-# Load and merge data from ETL output
-def load_data():
-    output_dir = "etl_output"
-    
-    dim_patient = pd.read_csv(os.path.join(output_dir, "dim_patient.csv"))
-    dim_hospital = pd.read_csv(os.path.join(output_dir, "dim_hospital.csv"))
-    dim_diagnosis = pd.read_csv(os.path.join(output_dir, "dim_diagnosis.csv"))
-    fact_admissions = pd.read_csv(os.path.join(output_dir, "fact_admissions.csv"))
-    
-    df = fact_admissions.merge(dim_patient, on="patient_key", how="left") \
-                        .merge(dim_hospital, on="hospital_key", how="left") \
-                        .merge(dim_diagnosis, on="diagnosis_key", how="left")
-    
-    race_grouped = {
-        'White': ['WHITE', 'WHITE - OTHER EUROPEAN', 'WHITE - RUSSIAN', 'WHITE - BRAZILIAN', 'WHITE - EASTERN EUROPEAN'],
-        'Black': ['BLACK/AFRICAN AMERICAN', 'BLACK/CARIBBEAN ISLAND', 'BLACK/AFRICAN', 'BLACK/CAPE VERDEAN'],
-        'Hispanic': ['HISPANIC/LATINO - PUERTO RICAN', 'HISPANIC/LATINO - HONDURAN', 'HISPANIC/LATINO - DOMINICAN', 'HISPANIC/LATINO - MEXICAN', 'HISPANIC/LATINO - SALVADORAN', 'HISPANIC/LATINO - GUATEMALAN', 'HISPANIC/LATINO - COLUMBIAN', 'HISPANIC/LATINO - CUBAN', 'HISPANIC/LATINO - CENTRAL AMERICAN', 'HISPANIC OR LATINO'],
-        'Asian': ['ASIAN - SOUTH EAST ASIAN', 'ASIAN', 'ASIAN - CHINESE', 'ASIAN - KOREAN', 'ASIAN - ASIAN INDIAN'],
-        'Other': ['OTHER', 'UNKNOWN', 'UNABLE TO OBTAIN', 'PATIENT DECLINED TO ANSWER', 'SOUTH AMERICAN', 'PORTUGUESE', 'NATIVE HAWAIIAN OR OTHER PACIFIC ISLANDER', 'AMERICAN INDIAN/ALASKA NATIVE']
-    }
-
-    def group_races(race_value):
-        for category, races in race_grouped.items():
-            if race_value in races:
-                return category
-        return 'Other/Unknown'
-
-    df['race_category'] = df['race'].apply(group_races)
-    df['gender_label'] = df['gender'].map({'M': 'Male', 'F': 'Female'})
-    
-    return df
-
-# Load merged data
-df = load_data()
+
+import debug_panel
+from data_loader import load_frame
+from filters import table_columns
+from instrumentation import start_trace
+from pagination import page_count, page_positions
+
+# timings of this rerun, in the sidebar with ?debug=1 (see debug_panel.py)
+trace = start_trace("Patients")
+trace.phase("load")
+
+# Load merged data; its filter masks and search index come from the same object, so they always match its rows
+frame = load_frame()
+df = frame.df
 
 st.title("Patients Overview")
 st.subheader("Search and Filters")
@@ -43,51 +20,64 @@ st.subheader("Search and Filters")
 # input field to search by patient ID
 search_id = st.text_input("Search by Patient ID")
 
-# calculate averages and add filters for higher than average scores
-avg_lace_score = df["lace_score"].mean()
-avg_cci_score = df["cci_score"].mean()
-avg_length_of_stay = df["length_of_stay"].mean()
+trace.phase("filters")
 
-high_lace_filter = st.checkbox(f"Filter by High LACE Score (> {avg_lace_score:.2f})", value=True)
-high_cci_filter = st.checkbox(f"Filter by High CCI Score (> {avg_cci_score:.2f})", value=True)
-high_los_filter = st.checkbox(f"Filter by High Length of Stay (> {avg_length_of_stay:.2f} days)", value=True)
+# higher than average filters; averages and masks are worked out once per dataset, not every rerun
+masks = frame.filter_masks()
+thresholds = masks.thresholds
 
-filtered_df = df.copy()
+high_lace_filter = st.checkbox(f"Filter by High LACE Score (> {thresholds['lace_score']:.2f})", value=True)
+high_cci_filter = st.checkbox(f"Filter by High CCI Score (> {thresholds['cci_score']:.2f})", value=True)
+high_los_filter = st.checkbox(f"Filter by High Length of Stay (> {thresholds['length_of_stay']:.2f} days)", value=True)
 
-# search for patient ID
-if search_id:
-    filtered_df = filtered_df[filtered_df["patient_id"].astype(str).str.contains(search_id)]
+# rows with a gap in any shown column are always left out of the table
+active = ["complete"] + [
+    name for name, checked in (
+        ("high_lace_score", high_lace_filter),
+        ("high_cci_score", high_cci_filter),
+        ("high_length_of_stay", high_los_filter),
+    ) if checked
+]
 
-# high lace
-if high_lace_filter:
-    filtered_df = filtered_df[filtered_df["lace_score"] > avg_lace_score]
+# search for patient ID, an exact ID or the start of one, through the prebuilt index
+search_rows = frame.patient_index().search(search_id) if search_id else None
 
-# high cci
-if high_cci_filter:
-    filtered_df = filtered_df[filtered_df["cci_score"] > avg_cci_score]
+# positions of the matching rows; nothing is copied out of df until the visible page
+rows = masks.select(active, search_rows)
 
-# high los
-if high_los_filter:
-    filtered_df = filtered_df[filtered_df["length_of_stay"] > avg_length_of_stay]
+trace.phase("table")
 
 # filter
-if not filtered_df.empty:
+if len(rows):
     st.subheader("Filtered Patients")
-    
-    filtered_table = filtered_df[[
-        "patient_id", "age", "gender", "length_of_stay",
-        "diagnosis_description", "cci_score", "lace_score"
-    ]].dropna()
-
-    # rename columns for visual clarity
-    filtered_table.columns = [
-        "Patient ID", "Age", "Gender", "Length of Stay",
-        "Diagnosis", "CCI Score", "LACE Score"
-    ]
+
+    # only the visible page is sorted out and sent to the browser, not every matching row
+    col_sort, col_order, col_size = st.columns(3)
+    with col_sort:
+        sort_label = st.selectbox("Sort by", ["None"] + list(table_columns.values()))
+    with col_order:
+        ascending = st.radio("Order", ["Ascending", "Descending"], horizontal=True) == "Ascending"
+    with col_size:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+
+    total = len(rows)
+    pages = page_count(total, page_size)
+    if st.session_state.get("page", 1) > pages:
+        st.session_state["page"] = pages
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key="page")
+
+    sort_column = {label: column for column, label in table_columns.items()}.get(sort_label)
+    positions = page_positions(df, rows, sort_column, ascending, page, page_size)
+    filtered_table = df.iloc[positions][list(table_columns)].rename(columns=table_columns)
+
+    start = (page - 1) * page_size
+    st.caption(f"Showing {start + 1}-{start + len(filtered_table)} of {total} matching admissions")
 
     # show filtered table
-    st.dataframe(filtered_table) 
-    
+    st.dataframe(filtered_table)
+
     # searched patient id doesnt exist
 else:
     st.write("No patients found with the selected filters.")
+
+debug_panel.show(trace)
@@ -0,0 +1,91 @@
+from functools import partial
+
+import streamlit as st
+
+import debug_panel
+from chart_cache import chart_spec, chart_specs
+from data_loader import load_headline, load_trends
+from instrumentation import start_trace
+from summaries import all_hospitals
+
+st.set_page_config(page_title="Patient Dashboard", layout="wide")
+
+# timings of this rerun, in the sidebar with ?debug=1 (see debug_panel.py)
+trace = start_trace("Trends")
+trace.phase("load")
+
+# drawn from the ETL's per day/week/month rollups, not the admissions themselves (see trends.py),
+# so any range or rolling window is quick however many years are loaded
+trends = load_trends()
+
+# most points drawn per chart, longer ranges are grouped into buckets of several periods
+max_points = 1000
+
+st.title("Admission Trends")
+
+hospital_keys = {"All hospitals": all_hospitals, **load_headline()["hospitals"]}
+col1, col2, col3 = st.columns(3)
+with col1:
+    selected_hospital = st.selectbox("Hospital", list(hospital_keys))
+with col2:
+    grain = st.radio("Group by", ["day", "week", "month"], index=2, horizontal=True, format_func=str.title)
+with col3:
+    window = st.number_input(f"Rolling window ({grain}s)", min_value=1, max_value=365, value=1)
+hospital_key = hospital_keys[selected_hospital]
+
+date_range = trends.date_range(hospital_key, grain)
+if date_range is None:
+    st.write("No admissions to show.")
+    debug_panel.show(trace)
+    st.stop()
+
+first, last = (day.date() for day in date_range)
+start, end = st.slider("Date range", min_value=first, max_value=last, value=(first, last), format="YYYY-MM-DD")
+
+def trend_chart(hospital_key, grain, start, end, window, column, title):
+    series, _ = trends.series(hospital_key, grain, start, end, window, max_points)
+    chart = alt.Chart(series).mark_line(color="#56B4E9").encode(
+        x=alt.X("period:T", title="Date"),
+        y=alt.Y(f"{column}:Q", title=title),
+        tooltip=[alt.Tooltip("period:T", title="From"), alt.Tooltip(f"{column}:Q", title=title, format=".2f")]
+    ).properties(
+        height=300,
+        title=title
+    ).configure_axis(
+        grid=False,
+        labelColor="#555",
+        titleColor="#222"
+    ).configure_title(
+        fontSize=18,
+        anchor='start',
+        font='Helvetica',
+        color='#333'
+    ).interactive(bind_y=False)  # scroll to zoom, drag to pan within the range
+    return chart
+
+trace.phase("charts")
+
+# altair is imported here rather than at the top so the controls are on screen without waiting for it
+import altair as alt
+
+series, bucket = trends.series(hospital_key, grain, start, end, window, max_points)
+if bucket > 1:
+    st.caption(f"{len(series)} points, each covering {bucket} {grain}s")
+if window > 1:
+    st.caption(f"Averaged over the {window} {'buckets' if bucket > 1 else grain + 's'} up to each point")
+
+# the three charts are worked out together on the shared chart pool (see chart_cache.py), each drawn in its place when ready
+admissions_title = "Admissions per " + (f"{bucket} {grain}s" if bucket > 1 else grain)
+charts = [
+    partial(chart_spec, trend_chart, hospital_key, grain, start, end, window, column, title, data=trends)
+    for column, title in [
+        ("admissions", admissions_title),
+        ("mean_length_of_stay", "Mean Length of Stay (days)"),
+        ("mean_lace_score", "Mean LACE Score"),
+    ]
+]
+slots = [st.empty() for _ in charts]
+for i, spec in chart_specs(charts):
+    slots[i].vega_lite_chart(spec, use_container_width=True)
+
+debug_panel.show(trace)
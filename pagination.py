@@ -0,0 +1,22 @@
+import numpy as np
+
+
+def page_positions(df, rows, sort_column=None, ascending=True, page=1, page_size=50):
+    # positions (into df) of the rows on one page of `rows`, sorted by `sort_column`.
+    # only the sort column of the matching rows is touched, the page itself is
+    # materialised by the caller with df.iloc
+    rows = np.asarray(rows)
+    if sort_column is not None:
+        values = df[sort_column].to_numpy()[rows]
+        order = np.argsort(values, kind="stable")
+        if not ascending:
+            # reversing a stable sort keeps ties in reverse order, so sort the reversed rows instead
+            order = len(values) - 1 - np.argsort(values[::-1], kind="stable")[::-1]
+        rows = rows[order]
+
+    start = (page - 1) * page_size
+    return rows[start:start + page_size]
+
+
+def page_count(total, page_size):
+    return max(1, -(-total // page_size))
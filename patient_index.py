@@ -0,0 +1,36 @@
+import numpy as np
+
+
+class PatientIndex:
+    # patient id search over the admissions frame, built once per data version.
+    # ids are kept as text sorted once, so an exact id is a dict lookup and a
+    # prefix is two binary searches, however many admissions are loaded
+    def __init__(self, patient_ids):
+        text = np.asarray(patient_ids).astype(str)
+        self.rows = np.argsort(text, kind="stable")  # row positions in id order
+        self.sorted_ids = text[self.rows]
+
+        ids, starts = np.unique(self.sorted_ids, return_index=True)
+        ends = np.append(starts[1:], len(self.sorted_ids))
+        self.exact = dict(zip(ids.tolist(), zip(starts.tolist(), ends.tolist())))
+
+    def _slice(self, start, end):
+        # positions in the frame's own order, so results read like a filter of it
+        return np.sort(self.rows[start:end])
+
+    def exact_rows(self, patient_id):
+        start, end = self.exact.get(str(patient_id).strip(), (0, 0))
+        return self._slice(start, end)
+
+    def prefix_rows(self, prefix):
+        prefix = str(prefix).strip()
+        start = np.searchsorted(self.sorted_ids, prefix, side="left")
+        end = np.searchsorted(self.sorted_ids, prefix + "\U0010ffff", side="left")
+        return self._slice(start, end)
+
+    def search(self, text):
+        # a full id returns that patient's rows, anything else every id starting with it
+        text = str(text).strip()
+        if text in self.exact:
+            return self.exact_rows(text)
+        return self.prefix_rows(text)
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+from summaries import all_hospitals
+
+# 30 day readmissions, what the LACE score predicts. every admission is an index admission: it
+# counts as readmitted when the same patient is admitted again (to any hospital) within 30 days
+# of its discharge. an admission starting before the discharge is a transfer and doesn't count.
+# patients are matched on patient_id, not patient_key, which changes when a patient's age does
+interval_table = "readmission_intervals"
+rate_table = "readmission_rates"
+
+readmission_days = 30
+
+# LACE risk bands
+lace_bands = {"Low (0-4)": (0, 5), "Moderate (5-9)": (5, 10), "High (10+)": (10, np.inf)}
+
+rate_dimensions = ["diagnosis_description", "lace_band"]
+all_rows = "all"  # dimension and value of the rows covering every admission of a hospital
+
+# admission columns kept in the interval table next to each interval, so an incremental run can
+# work out the patients with new admissions again, and update the rates, from that table alone
+admission_columns = [
+    "admission_id", "patient_id", "hospital_key", "diagnosis_description", "lace_score", "admittime", "dischtime",
+]
+
+_day = np.timedelta64(1, "D")
+
+
+def intervals(admissions):
+    # days from each admission's discharge to the same patient's next admission (NaN for the last one)
+    # and whether that's a readmission; one sort by patient and admit time, no per patient loop
+    admissions = admissions.loc[admissions["admittime"].notna(), admission_columns]
+    patient = admissions["patient_id"].to_numpy()
+    admit = admissions["admittime"].to_numpy("datetime64[ns]")
+    order = np.lexsort((admissions["admission_id"].to_numpy(), admit, patient))
+    patient, admit = patient[order], admit[order]
+    discharge = admissions["dischtime"].to_numpy("datetime64[ns]")[order]
+
+    has_next = np.append(patient[1:] == patient[:-1], False)
+    next_admit = np.append(admit[1:], np.datetime64("NaT"))
+    days = np.where(has_next, (next_admit - discharge) / _day, np.nan)
+    with np.errstate(invalid="ignore"):
+        readmitted = (days >= 0) & (days <= readmission_days)
+
+    result = admissions.iloc[order].assign(days_to_next=days, readmitted=readmitted.astype(np.int8))
+    return result.sort_values("admission_id", ignore_index=True)
+
+
+def update_intervals(existing, admissions):
+    # intervals after new admissions (admission_columns) arrived: only the patients with new admissions
+    # are worked out again, from their rows in `existing` (a new admission can make their previous last
+    # admission a readmission), the rest are kept. returns the intervals, the rows that were replaced
+    # and the rows replacing them, see update_rates
+    affected = existing["patient_id"].isin(admissions["patient_id"].unique())
+    replaced = existing[affected]
+    recomputed = intervals(pd.concat([replaced[admission_columns], admissions], ignore_index=True))
+    updated = pd.concat([existing[~affected], recomputed], ignore_index=True).sort_values("admission_id", ignore_index=True)
+    return updated, replaced, recomputed
+
+
+def lace_band(scores):
+    bands = pd.Series(pd.NA, index=scores.index, dtype=object)
+    for band, (low, high) in lace_bands.items():
+        bands[(scores >= low) & (scores < high)] = band
+    return bands
+
+
+def readmission_rates(intervals):
+    # index admissions and readmissions per hospital (all_hospitals for every one), overall and
+    # per diagnosis and LACE band, from rows of the interval table; counts rather than rates, so
+    # they add up across hospitals and runs
+    rows = intervals[["hospital_key", "diagnosis_description", "lace_score", "readmitted"]]
+    rows = rows.assign(lace_band=lace_band(rows["lace_score"]), **{all_rows: all_rows})
+
+    frames = []
+    for hospital_rows in (rows.assign(hospital_key=all_hospitals), rows):
+        for dimension in [all_rows] + rate_dimensions:
+            grouped = hospital_rows.assign(dimension=dimension, value=hospital_rows[dimension]) \
+                .dropna(subset=["value"]) \
+                .groupby(["hospital_key", "dimension", "value"], observed=True)["readmitted"]
+            frames.append(pd.DataFrame({"admissions": grouped.size(), "readmissions": grouped.sum()}).reset_index())
+    return merge_rates(frames)
+
+
+def merge_rates(frames):
+    # adds rate tables up; rows with negative counts take admissions back out, see update_rates
+    rates = pd.concat(frames, ignore_index=True)
+    rates = rates.assign(dimension=rates["dimension"].astype(str), value=rates["value"].astype(str))
+    rates = rates.groupby(["hospital_key", "dimension", "value"], as_index=False, sort=True)[["admissions", "readmissions"]].sum()
+    return rates[rates["admissions"] > 0].reset_index(drop=True)
+
+
+def update_rates(rates, replaced, recomputed):
+    # the rate table after the interval rows `replaced` were worked out again as `recomputed`
+    removed = readmission_rates(replaced)
+    removed[["admissions", "readmissions"]] *= -1
+    return merge_rates([rates, removed, readmission_rates(recomputed)])
+
+
+def readmission_counts(rates, hospital_key=all_hospitals):
+    # (readmissions, admissions) of a hospital, or of every hospital
+    row = rates[(rates["hospital_key"] == hospital_key) & (rates["dimension"] == all_rows)]
+    if row.empty:
+        return 0, 0
+    return int(row["readmissions"].iloc[0]), int(row["admissions"].iloc[0])
+
+
+def readmission_rate(rates, hospital_key=all_hospitals):
+    # share of admissions followed by a readmission, None without admissions
+    readmitted, admitted = readmission_counts(rates, hospital_key)
+    return readmitted / admitted if admitted else None
+
+
+def rates_by(rates, dimension, hospital_key=all_hospitals):
+    # admissions, readmissions and readmission rate per value of `dimension`
+    rows = rates[(rates["hospital_key"] == hospital_key) & (rates["dimension"] == dimension)]
+    rows = rows[["value", "admissions", "readmissions"]].rename(columns={"value": dimension})
+    return rows.assign(rate=rows["readmissions"] / rows["admissions"]).reset_index(drop=True)
@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from star_schema import current_dir, set_current, version_name, versions_dir
+
+try:
+    import pyarrow as pa
+except ImportError:  # only needed for the multi-worker mode
+    pa = None
+
+# multi-worker mode: one loader process (shared_loader.py) writes the dashboard's compact admissions
+# frame to an uncompressed Arrow IPC file, normally under /dev/shm, and every Streamlit process
+# memory maps it read-only instead of loading its own copy (see data_loader.shared_dir).
+# columns are stored as plain arrays without arrow nulls (category codes, text as category codes
+# too, datetimes as int64 with NaT, floats with NaN) so pandas can use the mapped buffers as they are; the pandas dtypes are
+# kept in the schema metadata. frames are published like ETL.py --publish, as
+# versions/<name>/admissions.arrow with the live one named in CURRENT
+
+frame_file = "admissions.arrow"
+
+
+def require_pyarrow():
+    if pa is None:
+        raise SystemExit("the shared memory mode needs pyarrow (pip install pyarrow)")
+
+
+def _encode(df):
+    arrays, columns = [], []
+    for name, values in df.items():
+        if not isinstance(values.dtype, pd.CategoricalDtype) and pd.api.types.is_string_dtype(values.dtype):
+            # text compact_admissions left as strings (mostly unique values) is shared as dictionary codes too
+            values = values.astype("category")
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            columns.append({"name": name, "categories": values.cat.categories.tolist(), "ordered": bool(values.cat.ordered)})
+            values = values.cat.codes.to_numpy()
+        elif isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufM":
+            columns.append({"name": name, "dtype": values.dtype.str})
+            values = values.to_numpy()
+            if values.dtype.kind in "bM":
+                # arrow packs booleans into bits and would turn NaT into nulls, both need a copy to read back
+                values = values.view(f"i{values.dtype.itemsize}")
+        else:
+            raise TypeError(f"column {name} ({values.dtype}) can't be shared, only numbers, datetimes, text and categories")
+        arrays.append(pa.array(values))
+    return arrays, columns
+
+
+def publish_frame(df, shared_dir, version, keep=2):
+    # writes df (its index isn't kept) as a new version in shared_dir and points CURRENT at it.
+    # `version` names the data it was made from, so workers can tell whether it's the one they need
+    require_pyarrow()
+    arrays, columns = _encode(df)
+    table = pa.Table.from_arrays(arrays, names=[column["name"] for column in columns])
+    table = table.replace_schema_metadata({"version": version, "columns": json.dumps(columns)})
+
+    versions = os.path.join(shared_dir, versions_dir)
+    os.makedirs(versions, exist_ok=True)
+    name = version_name()
+    staging = os.path.join(versions, name + ".staging")
+    os.makedirs(staging)
+    try:
+        with pa.OSFile(os.path.join(staging, frame_file), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    os.rename(staging, os.path.join(versions, name))
+    set_current(shared_dir, name)
+
+    # a worker still using an older version keeps its mapping after the file is removed
+    published = sorted(entry for entry in os.listdir(versions) if not entry.endswith(".staging"))
+    for old in published[:-keep]:
+        shutil.rmtree(os.path.join(versions, old), ignore_errors=True)
+    return name
+
+
+def _open(shared_dir):
+    # the live frame's file, None if nothing was published yet. callers close it when done; the
+    # buffers of a table read from it stay mapped until the table itself is released
+    try:
+        return pa.memory_map(os.path.join(current_dir(shared_dir), frame_file), "r")
+    except FileNotFoundError:
+        return None
+
+
+def shared_version(shared_dir):
+    # version of the frame live in shared_dir, None if nothing was published there yet
+    require_pyarrow()
+    source = _open(shared_dir)
+    if source is None:
+        return None
+    with source:
+        return pa.ipc.open_file(source).schema.metadata[b"version"].decode()
+
+
+def attach_frame(shared_dir):
+    # (frame, version, bytes mapped) of the live frame, None if there isn't one. the frame's columns are
+    # read-only views of the mapped file, shared with every other process that attached it
+    require_pyarrow()
+    source = _open(shared_dir)
+    if source is None:
+        return None
+    with source:
+        reader = pa.ipc.open_file(source)
+        metadata = reader.schema.metadata
+        table = reader.read_all()
+    data = {}
+    for spec, column in zip(json.loads(metadata[b"columns"]), table.columns):
+        # one chunk, as written; to_numpy only avoids the copy for a single array
+        values = column.chunk(0).to_numpy(zero_copy_only=True) if column.num_chunks == 1 else column.to_numpy()
+        if "categories" in spec:
+            dtype = pd.CategoricalDtype(spec["categories"], spec["ordered"])
+            data[spec["name"]] = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        else:
+            data[spec["name"]] = values.view(np.dtype(spec["dtype"]))
+    return pd.DataFrame(data, copy=False), metadata[b"version"].decode(), table.nbytes
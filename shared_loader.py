@@ -0,0 +1,44 @@
+import argparse
+import os
+import time
+import traceback
+
+import data_loader
+from shared_frame import frame_file, require_pyarrow
+from star_schema import versions_dir, versions_to_keep
+
+# the loader process of the multi-worker mode (see data_loader.shared_dir): polls the ETL output and
+# publishes its admissions frame to shared memory whenever there's a new one, once for every
+# dashboard process on the host. run one next to the Streamlit processes, with the same
+# DASHBOARD_SHARED_DIR (or --shared-dir) and ETL output folder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish the dashboard's admissions frame to shared memory.")
+    parser.add_argument("--output-dir", default=data_loader.output_dir, help="folder of the ETL output")
+    parser.add_argument("--shared-dir", default=data_loader.shared_dir or "/dev/shm/patient-dashboard",
+                        help="where to publish it, the DASHBOARD_SHARED_DIR of the dashboard processes")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between checks of the ETL output")
+    parser.add_argument("--keep", type=versions_to_keep, default=2,
+                        help="published versions to keep, a dashboard may still be using the previous one")
+    parser.add_argument("--once", action="store_true", help="publish the current ETL output and exit")
+    args = parser.parse_args()
+    require_pyarrow()
+
+    data_loader.output_dir = args.output_dir
+    while True:
+        try:
+            name = data_loader.publish_shared(args.shared_dir, args.keep)
+            if name is not None:
+                size = os.path.getsize(os.path.join(args.shared_dir, versions_dir, name, frame_file))
+                print(f"published {name} ({size / 2**20:.1f} MB) to {args.shared_dir}")
+        except Exception:
+            # e.g. no ETL output yet; the dashboards keep using the last published frame
+            traceback.print_exc()
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
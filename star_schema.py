@@ -0,0 +1,520 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import span
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for the parquet/arrow output formats
+    pa = None
+    pq = None
+
+tables = ["dim_patient", "dim_hospital", "dim_diagnosis", "fact_admissions"]
+
+# file extension for each output format, in the order the loaders prefer them
+formats = {"arrow": ".arrow", "parquet": ".parquet", "csv": ".csv"}
+
+# columns stored as dictionaries (categoricals once loaded into pandas)
+dictionary_columns = ["admission_type", "admission_location", "discharge_location", "Hospital"]
+datetime_columns = ["admittime", "dischtime", "period"]
+
+# columns of the merged admissions frame the dashboard reads; the source codes, LACE components
+# and raw race/ICD values stay in the tables (see compact_admissions)
+dashboard_columns = [
+    "admission_id", "patient_id", "patient_key", "hospital_key", "Hospital",
+    "admission_type", "admission_location", "discharge_location", "admittime", "dischtime",
+    "length_of_stay", "cci_score", "lace_score", "age", "gender", "gender_label", "race_category",
+    "diagnosis_description",
+]
+
+# the fact table is also written split by hospital, one folder per hospital_key,
+# so a single hospital's admissions can be read without the rest
+partitions_dir = "partitions"
+
+# published ETL output (ETL.py --publish) lives in versions/<name>/, with the name of the
+# live one in the CURRENT file; the pointer is swapped in one rename, so readers see
+# either the old version or the new one, never a half written table
+versions_dir = "versions"
+current_file = "CURRENT"
+
+race_grouped = {
+    'White': [
+        'WHITE',
+        'WHITE - OTHER EUROPEAN',
+        'WHITE - RUSSIAN',
+        'WHITE - BRAZILIAN',
+        'WHITE - EASTERN EUROPEAN'
+    ],
+    'Black': [
+        'BLACK/AFRICAN AMERICAN',
+        'BLACK/CARIBBEAN ISLAND',
+        'BLACK/AFRICAN',
+        'BLACK/CAPE VERDEAN'
+    ],
+    'Hispanic': [
+        'HISPANIC/LATINO - PUERTO RICAN',
+        'HISPANIC/LATINO - HONDURAN',
+        'HISPANIC/LATINO - DOMINICAN',
+        'HISPANIC/LATINO - MEXICAN',
+        'HISPANIC/LATINO - SALVADORAN',
+        'HISPANIC/LATINO - GUATEMALAN',
+        'HISPANIC/LATINO - COLUMBIAN',
+        'HISPANIC/LATINO - CUBAN',
+        'HISPANIC/LATINO - CENTRAL AMERICAN',
+        'HISPANIC OR LATINO'
+    ],
+    'Asian': [
+        'ASIAN - SOUTH EAST ASIAN',
+        'ASIAN',
+        'ASIAN - CHINESE',
+        'ASIAN - KOREAN',
+        'ASIAN - ASIAN INDIAN'
+    ],
+    'Other': [
+        'OTHER',
+        'UNKNOWN',
+        'UNABLE TO OBTAIN',
+        'PATIENT DECLINED TO ANSWER',
+        'SOUTH AMERICAN',
+        'PORTUGUESE',
+        'NATIVE HAWAIIAN OR OTHER PACIFIC ISLANDER',
+        'AMERICAN INDIAN/ALASKA NATIVE'
+    ]
+}
+
+# flattened once into race -> category, so labelling is a single vectorised map
+race_categories = {race: category for category, races in race_grouped.items() for race in races}
+
+gender_labels = {'M': 'Male', 'F': 'Female'}
+
+
+def add_patient_labels(dim_patient):
+    # race_category and gender_label are derived once per patient by the ETL, not per admission at request time
+    dim_patient = dim_patient.copy()
+    dim_patient['race_category'] = dim_patient['race'].map(race_categories).fillna('Other/Unknown')
+    dim_patient['gender_label'] = dim_patient['gender'].map(gender_labels)
+    return dim_patient
+
+
+def _schemas():
+    # explicit column types for the columnar formats, small ints for scores and keys
+    key = pa.int32()
+    label = pa.dictionary(pa.int32(), pa.string())
+    return {
+        "dim_patient": pa.schema([
+            ("patient_id", pa.int64()),
+            ("gender", pa.string()),
+            ("age", pa.int16()),
+            ("race", pa.string()),
+            ("patient_key", key),
+            ("race_category", pa.string()),
+            ("gender_label", pa.string()),
+        ]),
+        "dim_hospital": pa.schema([
+            ("Hospital", label),
+            ("hospital_key", key),
+        ]),
+        "dim_diagnosis": pa.schema([
+            ("icd_code", pa.string()),
+            ("icd_version", pa.int8()),
+            ("diagnosis_description", pa.string()),
+            ("diagnosis_key", key),
+        ]),
+        "fact_admissions": pa.schema([
+            ("admission_id", pa.int64()),
+            ("patient_key", key),
+            ("hospital_key", key),
+            ("diagnosis_key", key),
+            ("admission_type", label),
+            ("admission_location", label),
+            ("discharge_location", label),
+            ("admittime", pa.timestamp("s")),
+            ("dischtime", pa.timestamp("s")),
+            ("length_of_stay", pa.int16()),
+            ("cci_score", pa.int8()),
+            ("ed_visit_count", pa.int16()),
+            ("lace_l_score", pa.int8()),
+            ("lace_a_score", pa.int8()),
+            ("lace_e_score", pa.int8()),
+            ("lace_score", pa.int8()),
+        ]),
+        "summary_counts": pa.schema([
+            ("hospital_key", key),
+            ("dimension", label),
+            ("value", pa.string()),
+            ("patients", pa.int64()),
+            ("admissions", pa.int64()),
+        ]),
+        "summary_metrics": pa.schema([
+            ("hospital_key", key),
+            ("Hospital", label),
+            ("total_patients", pa.int64()),
+            ("total_admissions", pa.int64()),
+            ("avg_length_of_stay", pa.float64()),
+            ("avg_age", pa.float64()),
+            ("avg_lace_score", pa.float64()),
+            ("avg_cci_score", pa.float64()),
+            ("length_of_stay_sum", pa.float64()),
+            ("length_of_stay_count", pa.int64()),
+            ("age_sum", pa.float64()),
+            ("age_count", pa.int64()),
+            ("lace_score_sum", pa.float64()),
+            ("lace_score_count", pa.int64()),
+            ("cci_score_sum", pa.float64()),
+            ("cci_score_count", pa.int64()),
+        ]),
+        "trend_rollups": pa.schema([
+            ("hospital_key", key),
+            ("grain", label),
+            ("period", pa.timestamp("s")),
+            ("admissions", pa.int64()),
+            ("los_sum", pa.float64()),
+            ("los_count", pa.int64()),
+            ("lace_sum", pa.float64()),
+            ("lace_count", pa.int64()),
+        ]),
+        "readmission_intervals": pa.schema([
+            ("admission_id", pa.int64()),
+            ("patient_id", pa.int64()),
+            ("hospital_key", key),
+            ("diagnosis_description", label),
+            ("lace_score", pa.int8()),
+            ("admittime", pa.timestamp("s")),
+            ("dischtime", pa.timestamp("s")),
+            ("days_to_next", pa.float64()),
+            ("readmitted", pa.int8()),
+        ]),
+        "readmission_rates": pa.schema([
+            ("hospital_key", key),
+            ("dimension", label),
+            ("value", pa.string()),
+            ("admissions", pa.int64()),
+            ("readmissions", pa.int64()),
+        ]),
+    }
+
+
+def require_pyarrow(fmt):
+    if fmt != "csv" and pa is None:
+        raise SystemExit(f"the {fmt} output format needs pyarrow (pip install pyarrow)")
+
+
+def to_arrow(df, name):
+    schema = _schemas()[name]
+    df = df[schema.names].copy()
+    for column in datetime_columns:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column])
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+class TableWriter:
+    # writes a table one chunk at a time, so it never has to be held in memory whole.
+    # new files are written next to the old one and swapped in on close(); with
+    # append=True the existing rows are kept, csv is appended to in place and the
+    # columnar formats stream the existing batches into the new file first
+    def __init__(self, name, output_dir, fmt="csv", append=False):
+        self.name = name
+        self.fmt = fmt
+        self.path = os.path.join(output_dir, name + formats[fmt])
+        self.append = append and os.path.exists(self.path)
+        self.rows = 0
+        self._target = self.path if self.append and fmt == "csv" else self.path + ".tmp"
+        self._sink = None
+        self._writer = None
+        self._dictionaries = {}  # column -> {value: index}, grown as chunks arrive
+
+    def _open(self):
+        if self.fmt == "csv":
+            self._sink = open(self._target, "a" if self.append else "w", newline="")
+            return
+
+        schema = _schemas()[self.name]
+        if self.fmt == "parquet":
+            self._writer = pq.ParquetWriter(self._target, schema)
+        else:
+            # arrow files can't replace a dictionary, only extend it, see _encode()
+            self._sink = pa.OSFile(self._target, "wb")
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self._writer = pa.ipc.new_file(self._sink, schema, options=options)
+
+        if self.append:
+            for batch in _iter_batches(self.path):
+                self._write_batch(batch.cast(schema))
+
+    def _encode(self, array, column):
+        # map the batch's dictionary onto one growing dictionary per column
+        known = self._dictionaries.setdefault(column, {})
+        positions = [known.setdefault(value, len(known)) for value in array.dictionary.to_pylist()]
+        indices = pa.array(positions, pa.int32()).take(array.indices)
+        return pa.DictionaryArray.from_arrays(indices, pa.array(list(known), pa.string()))
+
+    def _write_batch(self, batch):
+        if self.fmt == "arrow":
+            batch = pa.RecordBatch.from_arrays([
+                self._encode(array, field.name) if pa.types.is_dictionary(field.type) else array
+                for field, array in zip(batch.schema, batch.columns)
+            ], schema=batch.schema)
+        self._writer.write_batch(batch)
+
+    def write(self, df):
+        if self._sink is None and self._writer is None:
+            self._open()
+        if self.fmt == "csv":
+            df.to_csv(self._sink, header=not self.append and self.rows == 0, index=False)
+        else:
+            for batch in to_arrow(df, self.name).to_batches():
+                self._write_batch(batch)
+        self.rows += len(df)
+
+    def close(self):
+        if self._sink is None and self._writer is None:
+            if self.append:
+                return self.path
+            self._open()
+        if self._writer is not None:
+            self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        if self._target != self.path:
+            os.replace(self._target, self.path)
+        return self.path
+
+
+def write_table(df, name, output_dir, fmt="csv"):
+    writer = TableWriter(name, output_dir, fmt)
+    writer.write(df)
+    return writer.close()
+
+
+def append_table(df, name, output_dir, fmt="csv"):
+    # the columnar formats have no cheap append, so their files are rewritten
+    writer = TableWriter(name, output_dir, fmt, append=True)
+    if not df.empty:
+        writer.write(df)
+    return writer.close()
+
+
+def table_path(name, output_dir):
+    # newest file wins, so an older format left behind by a previous run is never read;
+    # on a tie the columnar formats are preferred
+    candidates = []
+    for rank, (fmt, ext) in enumerate(formats.items()):
+        if fmt != "csv" and pa is None:
+            continue
+        path = os.path.join(output_dir, name + ext)
+        if os.path.exists(path):
+            candidates.append((-os.stat(path).st_mtime_ns, rank, path))
+    if not candidates:
+        raise FileNotFoundError(f"no ETL output found for {name} in {output_dir}, run ETL.py first")
+    return min(candidates)[2]
+
+
+def path_format(path):
+    return next(fmt for fmt, ext in formats.items() if path.endswith(ext))
+
+
+def _iter_batches(path):
+    if path.endswith(".parquet"):
+        yield from pq.ParquetFile(path).iter_batches()
+        return
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+
+
+def _read_arrow(path, columns=None):
+    if path.endswith(".parquet"):
+        return pq.read_table(path, columns=columns)
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.select(columns) if columns else table
+
+
+def _csv_types(df):
+    for column in datetime_columns:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column])
+    for column in dictionary_columns:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def read_table(name, output_dir, path=None, columns=None):
+    path = path or table_path(name, output_dir)
+    if path_format(path) != "csv":
+        return _read_arrow(path, columns).to_pandas()
+    return _csv_types(pd.read_csv(path, usecols=columns))
+
+
+def read_table_chunks(name, output_dir, chunksize=100_000):
+    # the table a part at a time: the record batches of the columnar formats (one per chunk the
+    # ETL wrote), csv in chunks of `chunksize` rows
+    path = table_path(name, output_dir)
+    if path_format(path) != "csv":
+        for batch in _iter_batches(path):
+            yield pa.Table.from_batches([batch]).to_pandas()
+        return
+    for df in pd.read_csv(path, chunksize=chunksize):
+        yield _csv_types(df)
+
+
+def current_dir(output_dir):
+    # folder holding the live tables: the CURRENT version if any were published, else output_dir itself
+    try:
+        with open(os.path.join(output_dir, current_file)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return output_dir
+    return os.path.join(output_dir, versions_dir, name)
+
+
+def set_current(output_dir, name):
+    tmp = os.path.join(output_dir, current_file + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(name + "\n")
+    os.replace(tmp, os.path.join(output_dir, current_file))
+
+
+def version_name():
+    # name for a new published version; names sort in the order the versions were made
+    now = time.time_ns()
+    return time.strftime("%Y%m%d-%H%M%S", time.localtime(now // 10**9)) + f"-{now % 10**9:09d}"
+
+
+def versions_to_keep(value):
+    # argparse type of the --keep options; the live version is always one of the kept ones
+    keep = int(value)
+    if keep < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, the live version is always kept")
+    return keep
+
+
+def partition_dir(output_dir, hospital_key):
+    return os.path.join(output_dir, partitions_dir, f"hospital_key={int(hospital_key)}")
+
+
+class PartitionWriter:
+    # writes the per hospital fact partitions a chunk of fact rows at a time, one TableWriter per
+    # hospital. with append=True the existing partitions are kept and only the hospitals that get
+    # rows are rewritten
+    def __init__(self, output_dir, fmt="csv", append=False):
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.append = append
+        self.writers = {}  # hospital_key -> TableWriter
+
+    def write(self, fact):
+        for hospital_key, rows in fact.groupby("hospital_key", sort=True):
+            writer = self.writers.get(hospital_key)
+            if writer is None:
+                path = partition_dir(self.output_dir, hospital_key)
+                os.makedirs(path, exist_ok=True)
+                writer = self.writers[hospital_key] = TableWriter("fact_admissions", path, self.fmt, self.append)
+            writer.write(rows)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+def write_partitions(fact, output_dir, fmt="csv", hospital_keys=None):
+    # (re)writes the fact partitions of `hospital_keys`, every hospital in `fact` if None
+    for hospital_key, rows in fact.groupby("hospital_key", sort=True):
+        if hospital_keys is not None and hospital_key not in hospital_keys:
+            continue
+        path = partition_dir(output_dir, hospital_key)
+        os.makedirs(path, exist_ok=True)
+        write_table(rows, "fact_admissions", path, fmt)
+
+
+def _read_dimensions(output_dir, paths):
+    # Load dimension tables
+    with span("read dimensions"):
+        dims = {
+            name: read_table(name, output_dir, paths.get(name))
+            for name in ["dim_patient", "dim_hospital", "dim_diagnosis"]
+        }
+
+    # outputs from before the ETL added the labels get them here, on the small patient table
+    if "race_category" not in dims["dim_patient"].columns:
+        with span("patient labels"):
+            dims["dim_patient"] = add_patient_labels(dims["dim_patient"])
+    return dims
+
+
+def _merge_dimensions(fact_admissions, output_dir, paths, dims=None):
+    dims = dims or _read_dimensions(output_dir, paths)
+
+    # Merge dimensions to fact table to reconstruct original columns needed for dashboard
+    with span("merge dimensions"):
+        df = fact_admissions.merge(dims["dim_patient"], on="patient_key", how="left") \
+                            .merge(dims["dim_hospital"], on="hospital_key", how="left") \
+                            .merge(dims["dim_diagnosis"], on="diagnosis_key", how="left")
+
+    return df
+
+
+def load_admissions(output_dir, paths=None):
+    # the fact table with every dimension merged back in, one row per admission
+    paths = paths or {}
+
+    # Load fact table
+    with span("read fact table"):
+        fact_admissions = read_table("fact_admissions", output_dir, paths.get("fact_admissions"))
+    return _merge_dimensions(fact_admissions, output_dir, paths)
+
+
+def iter_admissions(output_dir, chunksize=100_000):
+    # like load_admissions, a part of the fact table at a time (see read_table_chunks)
+    dims = _read_dimensions(output_dir, {})
+    for fact_admissions in read_table_chunks("fact_admissions", output_dir, chunksize):
+        yield _merge_dimensions(fact_admissions, output_dir, {}, dims)
+
+
+def compact_admissions(df, max_category_share=0.5):
+    # the merged frame cut down to the columns the dashboard reads, in the smallest types that hold
+    # them: repeated text as categoricals, integers downcast, whole number floats (scores with
+    # gaps) as float32. returns the compacted frame and its memory before and after, in bytes
+    before = int(df.memory_usage(deep=True).sum())
+    df = df[[column for column in dashboard_columns if column in df.columns]]
+    compacted = {}
+    for column, values in df.items():
+        if isinstance(values.dtype, pd.CategoricalDtype) or pd.api.types.is_datetime64_any_dtype(values):
+            continue
+        if pd.api.types.is_integer_dtype(values):
+            compacted[column] = pd.to_numeric(values, downcast="integer")
+        elif pd.api.types.is_float_dtype(values):
+            present = values.dropna()
+            if (present == present.round()).all() and present.abs().max(skipna=True) < 2 ** 24:
+                compacted[column] = values.astype(np.float32)
+        elif values.nunique() <= max_category_share * len(values):
+            compacted[column] = values.astype("category")
+    df = df.assign(**compacted)
+    return df, (before, int(df.memory_usage(deep=True).sum()))
+
+
+def read_partition(output_dir, hospital_key, paths=None, columns=None):
+    # one hospital's fact rows. output from an ETL that didn't write partitions falls back to
+    # filtering the whole fact table
+    paths = paths or {}
+    try:
+        fact_admissions = read_table("fact_admissions", partition_dir(output_dir, hospital_key), columns=columns)
+    except FileNotFoundError:
+        read_columns = None if columns is None else list(dict.fromkeys(columns + ["hospital_key"]))
+        fact_admissions = read_table("fact_admissions", output_dir, paths.get("fact_admissions"), read_columns)
+        fact_admissions = fact_admissions.loc[fact_admissions["hospital_key"] == hospital_key, columns or slice(None)]
+    return fact_admissions.reset_index(drop=True)
+
+
+def load_hospital_admissions(output_dir, hospital_key, paths=None):
+    # like load_admissions, for one hospital only; reads just its partition
+    paths = paths or {}
+    return _merge_dimensions(read_partition(output_dir, hospital_key, paths), output_dir, paths)
@@ -0,0 +1,167 @@
+import pandas as pd
+
+from instrumentation import span
+
+# small pre-aggregated tables written by the ETL, so the dashboard charts and metrics
+# cost the same however many admissions there are
+summary_tables = ["summary_counts", "summary_metrics"]
+
+# columns the charts count by. values are stored as text and numeric ones converted back on read
+count_columns = [
+    "admission_type", "admission_location", "discharge_location", "Hospital",
+    "length_of_stay", "cci_score", "lace_score", "age", "gender_label", "race_category",
+]
+numeric_columns = ["length_of_stay", "cci_score", "lace_score", "age"]
+
+# the Hospitals page leaves out admissions missing any of these, the per hospital numbers do the same
+required_columns = ['length_of_stay', 'age', 'lace_score', 'cci_score']
+
+all_hospitals = 0  # hospital_key of the rows covering every hospital
+all_rows = "all"  # dimension and value of the patient counts covering every admission of a hospital
+
+# summary_metrics also keeps the sums and counts behind its averages, so chunks of admissions and
+# incremental runs can be added up like the trend rollups
+averages = {
+    "avg_length_of_stay": "length_of_stay", "avg_age": "age", "avg_lace_score": "lace_score",
+    "avg_cci_score": "cci_score",
+}
+sum_columns = [f"{column}_{part}" for column in averages.values() for part in ("sum", "count")]
+
+count_keys = ["hospital_key", "dimension", "value"]
+
+
+def _groups(df):
+    # (rows, column) of every group the summaries count: every admission overall (Home page),
+    # the complete rows per hospital (Hospitals page)
+    per_hospital = df.dropna(subset=required_columns)
+    overall = df.assign(hospital_key=all_hospitals)
+    for column in count_columns:
+        for frame in (overall, per_hospital):
+            yield frame, column
+
+
+def _values(counts, column):
+    counts = counts.rename(columns={column: "value"})
+    counts.insert(1, "dimension", column)
+    counts["value"] = counts["value"].astype(str)
+    return counts
+
+
+def partial_summaries(df):
+    # admissions per chart value and the sums behind the averages, of some rows of the merged frame.
+    # they add up (merge_summaries); distinct patients don't, finish_summaries takes them from elsewhere
+    count_frames = []
+    for frame, column in _groups(df):
+        counts = frame.groupby(["hospital_key", column], observed=True).size().rename("admissions")
+        count_frames.append(_values(counts.reset_index(), column))
+
+    metric_frames = []
+    for frame in (df.assign(hospital_key=all_hospitals), df.dropna(subset=required_columns)):
+        grouped = frame.groupby("hospital_key", observed=True)
+        sums = {"total_admissions": grouped.size()}
+        for column in averages.values():
+            sums[f"{column}_sum"] = grouped[column].sum()
+            sums[f"{column}_count"] = grouped[column].count()
+        metric_frames.append(pd.DataFrame(sums).reset_index())
+    hospitals = df[["hospital_key", "Hospital"]].dropna().drop_duplicates()
+    summary_metrics = pd.concat([
+        metric_frames[0].assign(Hospital=None),
+        hospitals.merge(metric_frames[1], on="hospital_key", how="left"),
+    ], ignore_index=True)
+
+    return {"summary_counts": pd.concat(count_frames, ignore_index=True), "summary_metrics": summary_metrics}
+
+
+def merge_summaries(parts):
+    # adds up partial_summaries(), or summary tables written by the ETL (their patients and averages are dropped)
+    counts = pd.concat([part["summary_counts"][count_keys + ["admissions"]] for part in parts], ignore_index=True)
+    counts = counts.astype({"dimension": str, "value": str}) \
+        .groupby(count_keys, as_index=False, sort=False)["admissions"].sum()
+
+    metrics = pd.concat([
+        part["summary_metrics"][["hospital_key", "Hospital", "total_admissions"] + sum_columns].astype({"Hospital": object})
+        for part in parts
+    ], ignore_index=True)
+    metrics = metrics.fillna({column: 0 for column in ["total_admissions"] + sum_columns})
+    metrics = metrics.groupby("hospital_key", as_index=False, sort=True).agg(
+        Hospital=("Hospital", "first"), **{column: (column, "sum") for column in ["total_admissions"] + sum_columns}
+    )
+    return {"summary_counts": counts, "summary_metrics": metrics}
+
+
+def finish_summaries(summaries, patients):
+    # the summary tables from merged partial summaries and `patients`, distinct patients per hospital_key,
+    # dimension and value, with dimension and value all_rows for every patient of a hospital
+    counts = summaries["summary_counts"].merge(patients, on=count_keys, how="left")
+    # numbers in numeric order, text in alphabetical order, the way the charts list them
+    number = pd.to_numeric(counts["value"], errors="coerce").where(counts["dimension"].isin(numeric_columns))
+    counts = counts.assign(number=number).sort_values(["hospital_key", "dimension", "number", "value"])
+    summary_counts = counts[["hospital_key", "dimension", "value", "patients", "admissions"]].reset_index(drop=True)
+
+    totals = patients.loc[patients["dimension"] == all_rows, ["hospital_key", "patients"]]
+    metrics = summaries["summary_metrics"].merge(totals.rename(columns={"patients": "total_patients"}),
+                                                 on="hospital_key", how="left")
+    metrics[["total_patients", "total_admissions"]] = \
+        metrics[["total_patients", "total_admissions"]].fillna(0).astype("int64")
+    for average, column in averages.items():
+        metrics[average] = metrics[f"{column}_sum"] / metrics[f"{column}_count"]
+
+    return {
+        "summary_counts": summary_counts.astype({"patients": "int64", "admissions": "int64"}),
+        "summary_metrics": metrics[[
+            "hospital_key", "Hospital", "total_patients", "total_admissions",
+            "avg_length_of_stay", "avg_age", "avg_lace_score", "avg_cci_score",
+        ] + sum_columns],
+    }
+
+
+def patient_counts(df):
+    # distinct patients per summary group (see finish_summaries) of the whole merged frame, by patient_id
+    frames = []
+    for frame, column in _groups(df):
+        patients = frame.groupby(["hospital_key", column], observed=True)["patient_id"].nunique()
+        frames.append(_values(patients.rename("patients").reset_index(), column))
+    for frame in (df.assign(hospital_key=all_hospitals), df.dropna(subset=required_columns)):
+        patients = frame.groupby("hospital_key", observed=True)["patient_id"].nunique().rename("patients")
+        frames.append(patients.reset_index().assign(dimension=all_rows, value=all_rows))
+    return pd.concat(frames, ignore_index=True)
+
+
+def build_summaries(df):
+    # overall numbers use every admission (Home page), per hospital ones the complete rows only (Hospitals page)
+    with span("admission counts + sums"):
+        summaries = merge_summaries([partial_summaries(df)])
+    with span("patient counts"):
+        patients = patient_counts(df)
+    return finish_summaries(summaries, patients)
+
+
+# `summaries` below is either the dict of summary tables or a query backend answering the same
+# questions itself (database.SQLSummaries), see data_loader.backend
+
+
+def counts_by(summaries, column, hospital_key=all_hospitals, measure="patients"):
+    # distinct patients (or admissions) per value of `column`, like groupby(column)["patient_id"].nunique()
+    if not isinstance(summaries, dict):
+        return summaries.counts_by(column, hospital_key, measure)
+    counts = summaries["summary_counts"]
+    rows = counts[(counts["hospital_key"] == hospital_key) & (counts["dimension"] == column)]
+    rows = rows[["value", measure]].rename(columns={"value": column}).reset_index(drop=True)
+    if column in numeric_columns:
+        rows[column] = pd.to_numeric(rows[column])
+    return rows
+
+
+def hospital_metrics(summaries, hospital_key=all_hospitals):
+    if not isinstance(summaries, dict):
+        return summaries.hospital_metrics(hospital_key)
+    metrics = summaries["summary_metrics"]
+    return metrics[metrics["hospital_key"] == hospital_key].iloc[0]
+
+
+def hospitals(summaries):
+    # hospital name -> hospital_key
+    if not isinstance(summaries, dict):
+        return summaries.hospitals()
+    metrics = summaries["summary_metrics"].dropna(subset=["Hospital"])
+    return dict(zip(metrics["Hospital"].astype(str), metrics["hospital_key"]))
@@ -0,0 +1,222 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# synthetic admissions shaped like the ETL's source (same columns, value sets and rough
+# distributions as the real extract) for benchmarking at sizes we don't have real data for.
+# the same rows and seed always give the same file
+
+columns = [
+    "admission_id", "patient_id", "gender", "age", "race", "Hospital", "icd_code", "icd_version",
+    "diagnosis_description", "admission_type", "admission_location", "discharge_location",
+    "admittime", "dischtime", "length_of_stay", "cci_score", "ed_visit_count",
+    "lace_l_score", "lace_a_score", "lace_e_score", "lace_score",
+]
+
+hospitals = {
+    "Blacktown Hospital": 0.166, "Bankstown-Lidcombe Hospital": 0.087, "Prince of Wales Hospital": 0.084,
+    "John Hunter Hospital": 0.084, "Campbelltown Hospital": 0.083, "Royal Prince Alfred Hospital": 0.083,
+    "Nepean Hospital": 0.083, "Liverpool Hospital": 0.083, "Concord Repatriation General Hospital": 0.083,
+    "Westmead Hospital": 0.083, "St George Hospital": 0.082,
+}
+
+diagnoses = {
+    "I5023": "Acute on chronic systolic (congestive) heart failure",
+    "I5031": "Acute diastolic (congestive) heart failure",
+    "I5032": "Chronic diastolic (congestive) heart failure",
+    "I5033": "Acute on chronic diastolic (congestive) heart failure",
+    "I5020": "Unspecified systolic (congestive) heart failure",
+    "I5021": "Acute systolic (congestive) heart failure",
+    "I5022": "Chronic systolic (congestive) heart failure",
+    "I509": "Heart failure, unspecified",
+    "I5030": "Unspecified diastolic (congestive) heart failure",
+    "I5043": "Acute on chronic combined systolic (congestive) and diastolic (congestive) heart failure",
+    "I5082": "Biventricular heart failure",
+    "I50813": "Acute on chronic right heart failure",
+    "I5041": "Acute combined systolic (congestive) and diastolic (congestive) heart failure",
+    "I50810": "Right heart failure, unspecified",
+    "I50811": "Acute right heart failure",
+    "I5084": "End stage heart failure",
+    "I501": "Left ventricular failure, unspecified",
+    "I50812": "Chronic right heart failure",
+    "I5042": "Chronic combined systolic (congestive) and diastolic (congestive) heart failure",
+    "I5089": "Other heart failure",
+    "I5040": "Unspecified combined systolic (congestive) and diastolic (congestive) heart failure",
+    "I50814": "Right heart failure due to left heart failure",
+    "I5083": "High output heart failure",
+}
+# a few common codes make up most admissions, like the real extract
+diagnosis_weights = 1 / np.arange(1, len(diagnoses) + 1) ** 1.5
+
+races = {
+    "WHITE": 0.5702, "BLACK/AFRICAN AMERICAN": 0.1544, "WHITE - OTHER EUROPEAN": 0.0462, "UNKNOWN": 0.0368,
+    "OTHER": 0.0332, "HISPANIC/LATINO - PUERTO RICAN": 0.0282, "WHITE - RUSSIAN": 0.0263,
+    "HISPANIC/LATINO - DOMINICAN": 0.0116, "BLACK/CARIBBEAN ISLAND": 0.0103, "ASIAN - CHINESE": 0.0099,
+    "UNABLE TO OBTAIN": 0.0095, "BLACK/CAPE VERDEAN": 0.0087, "BLACK/AFRICAN": 0.0074, "ASIAN": 0.0065,
+    "PORTUGUESE": 0.0061, "WHITE - EASTERN EUROPEAN": 0.0052, "HISPANIC/LATINO - GUATEMALAN": 0.0042,
+    "ASIAN - SOUTH EAST ASIAN": 0.0033, "HISPANIC/LATINO - SALVADORAN": 0.0027, "WHITE - BRAZILIAN": 0.0026,
+    "AMERICAN INDIAN/ALASKA NATIVE": 0.0023, "ASIAN - ASIAN INDIAN": 0.0022, "HISPANIC/LATINO - HONDURAN": 0.002,
+    "PATIENT DECLINED TO ANSWER": 0.0017, "HISPANIC/LATINO - CUBAN": 0.0017, "SOUTH AMERICAN": 0.0016,
+    "HISPANIC/LATINO - MEXICAN": 0.0013, "HISPANIC/LATINO - COLUMBIAN": 0.0013,
+    "HISPANIC/LATINO - CENTRAL AMERICAN": 0.0013, "NATIVE HAWAIIAN OR OTHER PACIFIC ISLANDER": 0.0004,
+    "ASIAN - KOREAN": 0.0004, "HISPANIC OR LATINO": 0.0003,
+}
+
+admission_types = {
+    "OBSERVATION ADMIT": 0.409, "EW EMER.": 0.222, "URGENT": 0.096, "EU OBSERVATION": 0.09,
+    "DIRECT OBSERVATION": 0.068, "SURGICAL SAME DAY ADMISSION": 0.053, "DIRECT EMER.": 0.033,
+    "ELECTIVE": 0.026, "AMBULATORY OBSERVATION": 0.004,
+}
+
+admission_locations = {
+    "PHYSICIAN REFERRAL": 0.405, "TRANSFER FROM HOSPITAL": 0.215, "WALK-IN/SELF REFERRAL": 0.175,
+    "EMERGENCY ROOM": 0.143, "CLINIC REFERRAL": 0.029, "TRANSFER FROM SKILLED NURSING FACILITY": 0.021,
+    "PROCEDURE SITE": 0.008, "INTERNAL TRANSFER TO OR FROM PSYCH": 0.002, "PACU": 0.001,
+    "AMBULATORY SURGERY TRANSFER": 0.001, "INFORMATION NOT AVAILABLE": 0.001,
+}
+
+discharge_locations = {
+    "HOME HEALTH CARE": 0.32, "HOME": 0.293, "NOT SPECIFIED": 0.159, "SKILLED NURSING FACILITY": 0.15,
+    "REHAB": 0.04, "CHRONIC/LONG TERM ACUTE CARE": 0.015, "AGAINST ADVICE": 0.008, "ACUTE HOSPITAL": 0.005,
+    "HOSPICE": 0.003, "OTHER FACILITY": 0.002, "PSYCH FACILITY": 0.002, "ASSISTED LIVING": 0.001,
+    "HEALTHCARE FACILITY": 0.0005, "DIED": 0.0005,
+}
+
+admissions_per_patient = 2.04
+first_admission = np.datetime64("2110-01-01T00:00", "m")
+admission_years = 100  # span patients' first admissions are spread over
+last_admission = np.datetime64("2240-01-01T00:00", "m")  # well inside pandas' nanosecond timestamps
+readmission_share = 0.2  # share of follow-up admissions within a month of the previous discharge
+
+_minutes_per_day = 24 * 60
+
+
+def _choice(rng, options, size):
+    # indexes into `options` (a dict of value -> weight, or a list of weights)
+    weights = np.asarray(list(options.values()) if isinstance(options, dict) else options, dtype=float)
+    return rng.choice(len(weights), size=size, p=weights / weights.sum())
+
+
+def _pick(values, indexes):
+    return np.asarray(list(values), dtype=object)[indexes]
+
+
+def _lace_length(length_of_stay):
+    # LACE "L" points: <1 day 0, 1-3 days 1, 4-6 days 3, 7-13 days 5, 14+ days 7
+    return np.select(
+        [length_of_stay < 1, length_of_stay < 4, length_of_stay < 7, length_of_stay < 14],
+        [0, 1, 3, 5], default=7,
+    )
+
+
+class Patients:
+    # per patient attributes shared by all of a patient's admissions
+    def __init__(self, count, rng):
+        self.count = count
+        self.gender = rng.choice(np.array(["M", "F"], dtype=object), size=count, p=[0.536, 0.464])
+        self.race = _choice(rng, races, count)
+        self.age = np.clip(rng.normal(64, 14, count), 18, 91).astype(np.int64)
+        self.hospital = _choice(rng, hospitals, count)  # where most of their admissions are
+        self.first = first_admission + rng.integers(0, admission_years * 365 * _minutes_per_day, count) \
+            .astype("timedelta64[m]")
+
+
+def _admissions(patients, patient, visit, rng):
+    # one row per (patient, visit number). follow-up visits come a while after the previous one,
+    # some within a month of discharge; gaps are drawn per visit and added up per patient
+    size = len(patient)
+    length_of_stay = np.minimum(rng.geometric(1 / 7.0, size) - 1, 230)
+    gaps = np.where(rng.random(size) < readmission_share, rng.uniform(0, 30, size), rng.exponential(500, size))
+    gaps = np.where(visit == 0, 0, gaps + np.roll(length_of_stay, 1))  # counted from the previous discharge
+    # running sum of the gaps within each patient (rows are grouped by patient, visits in order)
+    totals = np.cumsum(gaps)
+    starts = np.flatnonzero(visit == 0)
+    totals -= np.repeat(totals[starts] - gaps[starts], np.diff(np.append(starts, size)))
+
+    admittime = np.minimum(
+        patients.first[patient] + (totals * _minutes_per_day).astype(np.int64).astype("timedelta64[m]"), last_admission)
+    stay_minutes = (length_of_stay + rng.uniform(-0.45, 0.45, size).clip(-length_of_stay, None)) * _minutes_per_day
+    dischtime = admittime + np.maximum(stay_minutes, 1).astype(np.int64).astype("timedelta64[m]")
+    age = np.minimum(patients.age[patient] + (admittime - patients.first[patient]).astype(np.int64)
+                     // (365 * _minutes_per_day), 91)
+
+    hospital = np.where(rng.random(size) < 0.8, patients.hospital[patient], _choice(rng, hospitals, size))
+    diagnosis = _choice(rng, diagnosis_weights, size)
+    cci_score = np.clip(np.round(rng.normal(6.3, 2.4, size)), 1, 19).astype(np.int64)
+    ed_visit_count = np.minimum(rng.geometric(0.58, size) - 1, 36)
+    lace_l = _lace_length(length_of_stay)
+    lace_e = np.minimum(ed_visit_count, 4)
+    return {
+        "gender": patients.gender[patient],
+        "age": age,
+        "race": _pick(races, patients.race[patient]),
+        "Hospital": _pick(hospitals, hospital),
+        "icd_code": _pick(diagnoses, diagnosis),
+        "icd_version": 10,
+        "diagnosis_description": _pick(diagnoses.values(), diagnosis),
+        "admission_type": _pick(admission_types, _choice(rng, admission_types, size)),
+        "admission_location": _pick(admission_locations, _choice(rng, admission_locations, size)),
+        "discharge_location": _pick(discharge_locations, _choice(rng, discharge_locations, size)),
+        "admittime": np.datetime_as_string(admittime, unit="s"),
+        "dischtime": np.datetime_as_string(dischtime, unit="s"),
+        "length_of_stay": length_of_stay,
+        "cci_score": cci_score,
+        "ed_visit_count": ed_visit_count,
+        "lace_l_score": lace_l,
+        "lace_a_score": 0,
+        "lace_e_score": lace_e,
+        # the extract's LACE uses the CCI score itself as the comorbidity points
+        "lace_score": lace_l + cci_score + lace_e,
+    }
+
+
+def generate(path, rows, seed=0, chunksize=500_000):
+    # writes `rows` synthetic admissions to `path`, chunksize rows at a time so memory stays flat
+    rng = np.random.default_rng(seed)
+
+    # admissions per patient, about admissions_per_patient on average, for as many patients as it
+    # takes to reach `rows` (the last one's are cut short)
+    visits = rng.geometric(1 / admissions_per_patient, int(rows / admissions_per_patient * 1.2) + 10)
+    while visits.sum() < rows:
+        visits = np.append(visits, rng.geometric(1 / admissions_per_patient, len(visits)))
+    visits = visits[:np.searchsorted(np.cumsum(visits), rows) + 1]
+    patients = Patients(len(visits), rng)
+    patient = np.repeat(np.arange(patients.count), visits)[:rows]
+    starts = np.flatnonzero(np.diff(patient, prepend=-1))
+    visit = np.arange(rows) - np.repeat(starts, np.diff(np.append(starts, rows)))
+
+    # chunks of about chunksize rows, ending where a patient's admissions do
+    boundaries = np.append(starts, rows)
+    ends = np.unique(np.append(boundaries[np.searchsorted(boundaries, np.arange(chunksize, rows, chunksize))], rows))
+
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="") as f:
+        for start, end in zip(np.append(0, ends[:-1]).tolist(), ends.tolist()):
+            chunk_rng = np.random.default_rng([seed, start])
+            values = _admissions(patients, patient[start:end], visit[start:end], chunk_rng)
+            chunk = pd.DataFrame({
+                "admission_id": 20_000_000 + np.arange(start, end),
+                "patient_id": 10_000_000 + patient[start:end],
+                **values,
+            })[columns]
+            # shuffled, so a patient's admissions aren't next to each other in the source
+            chunk = chunk.iloc[chunk_rng.permutation(len(chunk))]
+            chunk.to_csv(f, header=start == 0, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic admissions CSV shaped like the ETL source.")
+    parser.add_argument("--rows", type=int, default=100_000, help="admissions to generate (10k to 10M is typical)")
+    parser.add_argument("--seed", type=int, default=0, help="same rows and seed, same file")
+    parser.add_argument("--output", default="synthetic.csv", help="CSV file to write")
+    args = parser.parse_args()
+    generate(args.output, args.rows, args.seed)
+    print(f"wrote {args.rows} admissions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from shared_frame import attach_frame, publish_frame, shared_version
+from star_schema import compact_admissions
+
+
+def test_publish_and_attach_mostly_unique_text(tmp_path):
+    # compact_admissions keeps text with mostly unique values as strings; it's shared all the same
+    df = pd.DataFrame({
+        "admission_id": [1, 2, 3],
+        "gender": ["F", "M", None],
+        "diagnosis_description": ["Sepsis", "Pneumonia", "Heart failure"],
+        "Hospital": ["North", "North", "South"],
+        "admittime": pd.to_datetime(["2024-01-01", "2024-01-02", None]),
+        "length_of_stay": [1.0, np.nan, 3.0],
+    })
+    compact = compact_admissions(df)[0]
+
+    publish_frame(compact, str(tmp_path), "v1")
+    assert shared_version(str(tmp_path)) == "v1"
+    attached, version, size = attach_frame(str(tmp_path))
+
+    assert version == "v1" and size > 0
+    assert list(attached.columns) == list(compact.columns)
+    for column in ["gender", "diagnosis_description"]:
+        assert attached[column].astype(object).where(attached[column].notna(), None).tolist() == \
+            df[column].astype(object).where(df[column].notna(), None).tolist()
+    pd.testing.assert_series_equal(attached["admittime"], compact["admittime"])
+    pd.testing.assert_series_equal(attached["length_of_stay"], compact["length_of_stay"])
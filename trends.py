@@ -0,0 +1,127 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from summaries import all_hospitals
+
+# admissions, length of stay and LACE per day/week/month, rolled up by the ETL. the rollups hold
+# sums and counts rather than means, so chunks, incremental runs, hospitals and longer windows
+# can all be combined by adding them up
+trend_table = "trend_rollups"
+
+# pandas frequency of each grain; weeks start on Monday
+grains = {"day": "D", "week": "W-MON", "month": "MS"}
+
+rollup_keys = ["hospital_key", "grain", "period"]
+rollup_measures = ["admissions", "los_sum", "los_count", "lace_sum", "lace_count"]
+
+
+def period_starts(times, grain):
+    days = times.to_numpy().astype("datetime64[D]")
+    if grain == "month":
+        starts = days.astype("datetime64[M]").astype("datetime64[D]")
+    elif grain == "week":
+        # 1970-01-01 was a Thursday, three days after a Monday
+        starts = days - ((days.astype(np.int64) + 3) % 7).astype("timedelta64[D]")
+    else:
+        starts = days
+    return starts.astype("datetime64[ns]")
+
+
+def rollups(fact):
+    # per hospital and overall rollups of fact rows (hospital_key, admittime, length_of_stay, lace_score)
+    fact = fact[fact["admittime"].notna()]
+    frames = []
+    for grain in grains:
+        rows = pd.DataFrame({
+            "hospital_key": fact["hospital_key"].to_numpy(),
+            "grain": grain,
+            "period": period_starts(fact["admittime"], grain),
+            "length_of_stay": fact["length_of_stay"].to_numpy(),
+            "lace_score": fact["lace_score"].to_numpy(),
+        })
+        for by_hospital in (True, False):
+            grouped = rows.assign(hospital_key=rows["hospital_key"] if by_hospital else all_hospitals) \
+                          .groupby(rollup_keys, observed=True)
+            frames.append(pd.DataFrame({
+                "admissions": grouped.size(),
+                "los_sum": grouped["length_of_stay"].sum(),
+                "los_count": grouped["length_of_stay"].count(),
+                "lace_sum": grouped["lace_score"].sum(),
+                "lace_count": grouped["lace_score"].count(),
+            }).reset_index())
+    return merge_rollups(frames)
+
+
+def merge_rollups(frames):
+    frames = [frame for frame in frames if frame is not None and len(frame)]
+    if not frames:
+        return pd.DataFrame({column: [] for column in rollup_keys + rollup_measures})
+    merged = pd.concat(frames, ignore_index=True)
+    merged["grain"] = merged["grain"].astype(str)
+    return merged.groupby(rollup_keys, as_index=False, sort=True)[rollup_measures].sum()
+
+
+def _day(value):
+    return np.datetime64(pd.Timestamp(value).date(), "D")
+
+
+class Trends:
+    # trend series over the rollups. each (hospital, grain) series is laid out once over every
+    # period between its first and last admission, as running totals, so the sums over any range
+    # or rolling window are two lookups, however many years of data there are
+    def __init__(self, rollups):
+        self.rollups = rollups
+        self._series = {}
+
+    def _running_totals(self, hospital_key, grain):
+        key = (hospital_key, grain)
+        if key not in self._series:
+            rows = self.rollups[(self.rollups["hospital_key"] == hospital_key) & (self.rollups["grain"] == grain)]
+            rows = rows.sort_values("period")
+            if rows.empty:
+                periods, positions = pd.DatetimeIndex([]), np.zeros(0, dtype=np.intp)
+            else:
+                periods = pd.date_range(rows["period"].iloc[0], rows["period"].iloc[-1], freq=grains[grain])
+                positions = periods.searchsorted(rows["period"])
+            totals = {}
+            for measure in rollup_measures:
+                dense = np.zeros(len(periods))
+                dense[positions] = rows[measure].to_numpy(float)
+                totals[measure] = np.concatenate([[0.0], np.cumsum(dense)])
+            self._series[key] = (periods, totals)
+        return self._series[key]
+
+    def date_range(self, hospital_key=all_hospitals, grain="day"):
+        periods, _ = self._running_totals(hospital_key, grain)
+        if not len(periods):
+            return None
+        return periods[0], periods[-1]
+
+    def series(self, hospital_key=all_hospitals, grain="day", start=None, end=None, window=1, max_points=None):
+        # one row per period from start to end: admissions per period, mean length of stay and mean LACE,
+        # each averaged over the `window` periods ending there. with more than max_points periods,
+        # consecutive periods are grouped into equal buckets (the window then counts buckets)
+        periods, totals = self._running_totals(hospital_key, grain)
+        days = periods.to_numpy().astype("datetime64[D]")  # dates outside pandas' nanosecond range compare too
+        first = days.searchsorted(_day(start), side="left") if start is not None else 0
+        last = days.searchsorted(_day(end), side="right") if end is not None else len(periods)
+        count = max(last - first, 0)
+        bucket = max(1, math.ceil(count / max_points)) if max_points else 1
+
+        # exclusive end of each bucket, counted back from the end so every bucket is whole;
+        # windows (and the first bucket) reach back before the range when there are periods there
+        ends = np.arange(last, first, -bucket)[::-1]
+        starts = np.maximum(ends - bucket * window, 0)
+
+        def window_sum(measure):
+            return totals[measure][ends] - totals[measure][starts]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.DataFrame({
+                "period": periods[np.maximum(ends - bucket, first)],
+                "admissions": window_sum("admissions") / ((ends - starts) / bucket),
+                "mean_length_of_stay": window_sum("los_sum") / window_sum("los_count"),
+                "mean_lace_score": window_sum("lace_sum") / window_sum("lace_count"),
+            }), bucket